@@ -0,0 +1,184 @@
+"""Compares the max, min and contact values of many variables between
+footstrike groups at once.
+
+    from loader import load_trials
+    from feature_stats import create_table, screen
+
+    trials = load_trials('./data', speeds=[25, 35, 45])
+    create_table(trials, ['RankleAngZ35', 'RkneeMomZ35'], ['contact', 'min'])
+    screen(trials)               # every variable and feature at every speed
+
+    python feature_stats.py --speeds 25 35 45 --output screen.csv
+
+The features of every subject and variable are taken from the stacked curves
+in one pass and saved next to the trial cache. Each table row is tested
+with the notebook's rules: Kruskal-Wallis when any group fails Shapiro-Wilk,
+one-way ANOVA otherwise, and Tukey HSD between each pair of groups. The
+tests run on whole (subjects, rows) arrays, so every row of a speed is
+tested together. Groups keep all of their subjects.
+"""
+import argparse
+import functools
+import os
+import time
+import numpy as np
+import pandas as pd
+from scipy.stats import f_oneway, kruskal, shapiro, studentized_range
+from loader import DATA_DIR, load_trials
+
+FEATURES = ('max', 'min', 'contact')
+GROUPS = ('Rearfoot', 'Midfoot', 'Forefoot')
+# Tukey pairs in the order pairwise_tukeyhsd reports them, as group indices.
+PAIRS = {'FF-MF': (2, 1), 'FF-RF': (2, 0), 'MF-RF': (1, 0)}
+TABLE_COLUMNS = ['RF_mean', 'RF_SD', 'MF_mean', 'MF_SD', 'FF_mean', 'FF_SD',
+                 'F/H_value', 'p_value'] + list(PAIRS)
+ALPHA = 0.05
+
+_features = {}
+
+
+def extract_features(curves):
+    """Returns a (features, subjects, variables) array of each curve's max,
+    min and value at initial contact, the first point of the gait cycle."""
+    curves = np.asarray(curves)
+    return np.stack([curves.max(axis=1), curves.min(axis=1), curves[:, 0]])
+
+
+def get_features(trials):
+    """The feature array of a TrialSet, computed once and saved in its
+    cache directory, which is already keyed by the trial files."""
+
+    if trials.cache_dir not in _features:
+        path = os.path.join(trials.cache_dir, 'features.npy')
+        if not os.path.exists(path):
+            temp_path = path + '.tmp.npy'
+            np.save(temp_path, extract_features(trials.curves))
+            os.replace(temp_path, path)
+        _features[trials.cache_dir] = np.load(path)
+    return _features[trials.cache_dir]
+
+
+@functools.lru_cache(maxsize=None)
+def tukey_critical_value(groups, degrees_of_freedom, alpha):
+    """The studentized range above which a Tukey pair differs."""
+    return studentized_range.ppf(1 - alpha, groups, degrees_of_freedom)
+
+
+def tukey_rejections(groups, alpha=ALPHA):
+    """Tukey-Kramer HSD for every column of the (subjects, rows) group
+    arrays. Returns a (rows, pairs) array, 1 where the pair differs."""
+
+    sizes = np.array([len(group) for group in groups])
+    means = [group.mean(axis=0) for group in groups]
+    degrees_of_freedom = sizes.sum() - len(groups)
+    within = sum(((group - mean) ** 2).sum(axis=0)
+                 for group, mean in zip(groups, means)) / degrees_of_freedom
+    critical = tukey_critical_value(len(groups), int(degrees_of_freedom),
+                                    alpha)
+
+    rejections = []
+    for first, second in PAIRS.values():
+        spread = np.sqrt(within / 2 * (1 / sizes[first] + 1 / sizes[second]))
+        ranges = np.abs(means[first] - means[second]) / spread
+        rejections.append(ranges > critical)
+    return np.stack(rejections, axis=1).astype(int)
+
+
+def compare_groups(groups, alpha=ALPHA):
+    """Runs the table's tests on every column of the (subjects, rows) group
+    arrays. Returns a (rows, TABLE_COLUMNS) array."""
+
+    summary = []
+    for group in groups:
+        summary += [group.mean(axis=0), group.std(axis=0)]
+
+    # Kruskal-Wallis for rows where any group is not normally distributed.
+    not_normal = np.zeros(groups[0].shape[1], dtype=bool)
+    for group in groups:
+        not_normal |= shapiro(group, axis=0).pvalue < alpha
+    anova = f_oneway(*groups, axis=0)
+    ranks = kruskal(*groups, axis=0)
+    statistic = np.where(not_normal, ranks.statistic, anova.statistic)
+    p_value = np.where(not_normal, ranks.pvalue, anova.pvalue)
+
+    return np.column_stack(summary + [statistic, p_value,
+                                      tukey_rejections(groups, alpha)])
+
+
+def row_values(trials, variables, features):
+    """The (subjects, rows) values of the given (variable, feature) rows and
+    the metadata column holding each row's footstrike groups, e.g. RFSI35
+    for RkneeMomZ35."""
+
+    for feature in set(features) - set(FEATURES):
+        raise ValueError('Unknown feature {!r}, expected one of {}'.format(
+            feature, ', '.join(FEATURES)))
+    columns = [trials.variables.index(variable) for variable in variables]
+    kinds = [FEATURES.index(feature) for feature in features]
+    group_columns = np.array(['{}FSI{}'.format(trials.side,
+                                               trials.speed_of(variable))
+                              for variable in variables])
+    return get_features(trials)[kinds, :, columns].T, group_columns
+
+
+def feature_table(trials, variables, features, alpha=ALPHA):
+    """Tests the given (variable, feature) rows between the footstrike
+    groups of each row's speed."""
+
+    # Testing the rows of each speed together, against that speed's groups.
+    values, group_columns = row_values(trials, variables, features)
+    results = np.empty((len(variables), len(TABLE_COLUMNS)))
+    for group_column in np.unique(group_columns):
+        rows = group_columns == group_column
+        labels = trials.metadata[group_column]
+        groups = [values[labels == group][:, rows] for group in GROUPS]
+        results[rows] = compare_groups(groups, alpha)
+
+    table = pd.DataFrame(results, columns=TABLE_COLUMNS,
+                         index=pd.MultiIndex.from_arrays(
+                             [variables, features],
+                             names=['variable', 'feature']))
+    table = table.round({'RF_mean': 2, 'RF_SD': 2, 'MF_mean': 2, 'MF_SD': 2,
+                         'FF_mean': 2, 'FF_SD': 2, 'F/H_value': 2,
+                         'p_value': 3})
+    return table.astype({pair: int for pair in PAIRS})
+
+
+def create_table(trials, variable_list, biomech_variable_type_list,
+                 alpha=ALPHA):
+    """The notebook's create_table: one row per variable and its
+    'max', 'min' or 'contact' feature."""
+    return feature_table(trials, list(variable_list),
+                         list(biomech_variable_type_list), alpha)
+
+
+def screen(trials, features=FEATURES, alpha=ALPHA):
+    """Tests every loaded variable with every feature."""
+    variables = [variable for variable in trials.variables
+                 for _ in features]
+    return feature_table(trials, variables, list(features) * len(
+        trials.variables), alpha)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Tests every variable for footstrike differences.')
+    parser.add_argument('--data', default=DATA_DIR,
+                        help='directory of RBDSinfo.txt and processed_data')
+    parser.add_argument('--speeds', nargs='+', default=['35'])
+    parser.add_argument('--side', default='R', choices=['R', 'L'])
+    parser.add_argument('--output', help='also write the table to this CSV')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    trials = load_trials(args.data, args.speeds, args.side)
+    table = screen(trials)
+    print(table.sort_values('p_value').head(20))
+    print('{} rows from {} subjects in {:.2f} s'.format(
+        len(table), len(trials), time.perf_counter() - start))
+    if args.output:
+        table.to_csv(args.output)
+
+
+if __name__ == '__main__':
+    main()
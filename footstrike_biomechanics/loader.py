@@ -0,0 +1,200 @@
+"""Loads the processed running trials into one cached 3-D array.
+
+    from loader import load_trials
+
+    trials = load_trials('./data', speeds=[35], side='R')
+    trials.curves                # subjects x gait cycle % x variables
+    trials.variable('RkneeAngZ35')
+    trials.metadata['RFSI35']    # footstrike of each subject at 3.5 m/s
+
+Trial files are parsed on a process pool, reading only the PercGcycle column
+and the columns of the requested side and speeds. The stacked array is saved
+under data/cache with a key made from every file's name, size and mtime, so
+later loads map the saved array instead of parsing again.
+"""
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import numpy as np
+import pandas as pd
+
+DATA_DIR = './data'
+CACHE_VERSION = 1
+
+
+def column_pattern(speeds, side):
+    """Matches the columns of one side at the given speeds, e.g. RkneeAngZ35
+    or RgrfY35."""
+    return re.compile('^{}.*({})$'.format(
+        re.escape(side), '|'.join(str(speed) for speed in speeds)))
+
+
+def subject_number(path):
+    """The subject of a trial file, the first number in its name."""
+    match = re.search(r'\d+', os.path.basename(path))
+    return int(match.group()) if match else None
+
+
+def read_trial(path, pattern):
+    """Parses one trial file, keeping PercGcycle and the matching columns.
+    Missing values are set to 0 as in the notebook."""
+
+    def wanted(column):
+        return column == 'PercGcycle' or bool(pattern.match(column))
+
+    trial = pd.read_csv(path, sep='\t', header=0, usecols=wanted)
+    trial = trial.fillna(0)
+    variables = [column for column in trial.columns if column != 'PercGcycle']
+    return (trial['PercGcycle'].to_numpy(dtype=float), variables,
+            trial[variables].to_numpy(dtype=float))
+
+
+def read_metadata(path):
+    """Reads RBDSinfo.txt with one row per subject, as the notebook does."""
+    metadata = pd.read_csv(path, sep='\t', header=0)
+    metadata = metadata.drop(columns=['FileName'], errors='ignore')
+    return metadata.drop_duplicates(subset=['Subject']).reset_index(drop=True)
+
+
+def cache_key(paths, speeds, side):
+    """Hashes everything the cached arrays depend on."""
+    digest = hashlib.sha1(json.dumps(
+        [CACHE_VERSION, list(map(str, speeds)), side]).encode())
+    for path in paths:
+        stat = os.stat(path)
+        digest.update('{}:{}:{}\n'.format(os.path.basename(path),
+                                          stat.st_size,
+                                          stat.st_mtime_ns).encode())
+    return digest.hexdigest()[:16]
+
+
+class TrialSet:
+    """The trials of every subject as arrays.
+
+    curves is a (subjects, gait cycle points, variables) array, percent the
+    gait cycle % of each point, variables the column names and subjects the
+    subject numbers. speeds and side are those the trials were loaded with.
+    metadata maps each RBDSinfo.txt column to an array aligned with
+    subjects."""
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        with open(os.path.join(cache_dir, 'meta.json')) as file:
+            meta = json.load(file)
+        self.variables = meta['variables']
+        self.subjects = np.array(meta['subjects'])
+        self.speeds = meta['speeds']
+        self.side = meta['side']
+        self.curves = np.load(os.path.join(cache_dir, 'curves.npy'),
+                              mmap_mode='r')
+        self.percent = np.load(os.path.join(cache_dir, 'percent.npy'))
+        with np.load(os.path.join(cache_dir, 'metadata.npz')) as metadata:
+            self.metadata = {name: metadata[name]
+                             for name in meta['metadata_columns']}
+
+    def __len__(self):
+        return len(self.subjects)
+
+    def variable(self, name):
+        """A variable's (subjects, gait cycle points) curves."""
+        return self.curves[:, :, self.variables.index(name)]
+
+    def speed_of(self, name):
+        """The speed a variable was recorded at, e.g. '35' for RkneeAngZ35."""
+        return next(speed for speed in self.speeds if name.endswith(speed))
+
+    def groups(self, column):
+        """Maps each value of a metadata column, e.g. 'RFSI35', to the
+        indices of the subjects with that value."""
+        values = self.metadata[column]
+        return {value: np.flatnonzero(values == value)
+                for value in pd.unique(values)}
+
+    def group_means(self, column):
+        """The mean curves of each group as DataFrames laid out like the
+        notebook's rearfoot_avg, midfoot_avg and forefoot_avg."""
+        means = {}
+        for value, indices in self.groups(column).items():
+            means[value] = pd.DataFrame(self.curves[indices].mean(axis=0),
+                                        columns=self.variables)
+            means[value].insert(0, 'PercGcycle', self.percent)
+        return means
+
+    def subject_frame(self, index):
+        """One subject's trial as a DataFrame, like the notebook's
+        biomech_35 entries."""
+        frame = pd.DataFrame(np.asarray(self.curves[index]),
+                             columns=self.variables)
+        frame.insert(0, 'PercGcycle', self.percent)
+        return frame
+
+
+def build_cache(paths, metadata_path, speeds, side, cache_dir, workers):
+    """Parses every trial and writes the arrays, meta.json last."""
+
+    pattern = column_pattern(speeds, side)
+    tasks = [(path, pattern) for path in paths]
+    if workers == 1:
+        trials = [read_trial(*task) for task in tasks]
+    else:
+        with multiprocessing.Pool(workers) as pool:
+            trials = pool.starmap(read_trial, tasks)
+
+    percent, variables, _ = trials[0]
+    for path, (trial_percent, trial_variables, values) in zip(paths, trials):
+        if trial_variables != variables or len(trial_percent) != len(percent):
+            raise ValueError('{} does not match the layout of {}'.format(
+                path, paths[0]))
+    curves = np.stack([values for _, _, values in trials])
+
+    # Matching metadata rows to trials by subject number, trials without a
+    # number in their name are matched by position.
+    subjects = [subject_number(path) for path in paths]
+    if None in subjects:
+        subjects = list(range(1, len(paths) + 1))
+    metadata = read_metadata(metadata_path).set_index('Subject').reindex(
+        subjects)
+    metadata_arrays = {}
+    for column in metadata.columns:
+        values = metadata[column]
+        metadata_arrays[column] = (
+            values.to_numpy() if pd.api.types.is_numeric_dtype(values)
+            else values.astype(str).to_numpy(dtype=str))
+
+    os.makedirs(cache_dir, exist_ok=True)
+    np.save(os.path.join(cache_dir, 'curves.npy'), curves)
+    np.save(os.path.join(cache_dir, 'percent.npy'), percent)
+    np.savez(os.path.join(cache_dir, 'metadata.npz'), **metadata_arrays)
+    meta = {'version': CACHE_VERSION, 'variables': variables,
+            'subjects': subjects, 'speeds': list(map(str, speeds)),
+            'side': side, 'metadata_columns': list(metadata_arrays),
+            'files': [os.path.basename(path) for path in paths]}
+    temp_path = os.path.join(cache_dir, 'meta.json.tmp')
+    with open(temp_path, 'w') as file:
+        json.dump(meta, file, indent=1)
+    os.replace(temp_path, os.path.join(cache_dir, 'meta.json'))
+
+
+def load_trials(data_dir=DATA_DIR, speeds=(35,), side='R', workers=None,
+                cache_dir=None):
+    """Returns a TrialSet of the given speeds and side ('R' or 'L') for every
+    file in data_dir/processed_data, parsing them only when no cache matches
+    the files' current names, sizes and mtimes."""
+
+    paths = sorted(glob.glob(os.path.join(data_dir, 'processed_data',
+                                          '*.txt')))
+    if not paths:
+        raise FileNotFoundError('No trial files in {}'.format(
+            os.path.join(data_dir, 'processed_data')))
+    metadata_path = os.path.join(data_dir, 'RBDSinfo.txt')
+    key = cache_key(paths + [metadata_path], speeds, side)
+    cache_dir = os.path.join(cache_dir or os.path.join(data_dir, 'cache'),
+                             key)
+
+    if not os.path.exists(os.path.join(cache_dir, 'meta.json')):
+        workers = workers or min(len(paths), multiprocessing.cpu_count())
+        build_cache(paths, metadata_path, speeds, side, cache_dir, workers)
+    return TrialSet(cache_dir)
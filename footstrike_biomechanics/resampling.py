@@ -0,0 +1,268 @@
+"""Bootstrap confidence intervals and permutation tests for the footstrike
+comparisons, without assuming normal groups.
+
+    from loader import load_trials
+    from resampling import resampling_table, curve_comparison
+
+    trials = load_trials('./data', speeds=[35])
+    resampling_table(trials, ['RkneeMomZ35', 'RankleAngZ35'],
+                     ['min', 'contact'])
+    curve_comparison(trials, 'RkneeAngZ35')
+
+    python resampling.py --variables RkneeMomZ35 RankleAngZ35 \\
+        --features min contact --resamples 20000 --curve RkneeAngZ35
+
+Resamples are drawn a batch at a time, permutations as shuffled index arrays
+and bootstrap samples as counts of each subject, and every row is scored
+from the same batch with matrix products. Batches run in parallel on
+a process pool; each has its own seed spawned from the main seed, so results
+are the same for the same seed whatever the number of workers.
+
+curve_comparison tests a whole curve across PercGcycle, as in statistical
+parametric mapping: the F statistic is computed at every point and compared
+with the distribution of the largest F over the curve under permutation,
+which controls the error rate over the whole gait cycle.
+"""
+import argparse
+import multiprocessing
+import time
+import numpy as np
+import pandas as pd
+from feature_stats import ALPHA, FEATURES, GROUPS, PAIRS, row_values
+from loader import DATA_DIR, load_trials
+
+RESAMPLES = 10000
+BATCH_SIZE = 1000
+TABLE_COLUMNS = ['RF_mean', 'RF_low', 'RF_high', 'MF_mean', 'MF_low',
+                 'MF_high', 'FF_mean', 'FF_low', 'FF_high', 'F_value',
+                 'p_value'] + list(PAIRS)
+
+_values = None
+_codes = None
+_observed = None
+
+
+def group_codes(labels):
+    """Numbers each subject by its group in GROUPS. Returns the codes of
+    the subjects in a group and a mask of those subjects."""
+    codes = np.full(len(labels), -1)
+    for code, group in enumerate(GROUPS):
+        codes[np.asarray(labels) == group] = code
+    return codes[codes >= 0], codes >= 0
+
+
+def batch_seeds(seed, resamples, batch_size=BATCH_SIZE):
+    """Splits the resamples into batches, each with its own seed spawned
+    from seed, an int or a SeedSequence."""
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    sizes = [batch_size] * (resamples // batch_size)
+    if resamples % batch_size:
+        sizes.append(resamples % batch_size)
+    return list(zip(seed.spawn(len(sizes)), sizes))
+
+
+def f_statistics(values, codes):
+    """One-way ANOVA F of every column of values, a (subjects, columns)
+    array, for each row of codes, a (resamples, subjects) array of group
+    codes. Returns a (resamples, columns) array."""
+
+    size = values.shape[0]
+    total = values.sum(axis=0)
+    total_squares = (values ** 2).sum(axis=0) - total ** 2 / size
+
+    # Between group sum of squares from each group's sums, a product each.
+    between = -total ** 2 / size
+    for code in range(len(GROUPS)):
+        members = (codes == code).astype(values.dtype)
+        sums = members @ values
+        between = between + sums ** 2 / members.sum(axis=1, keepdims=True)
+    within = np.maximum(total_squares - between, 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return ((between / (len(GROUPS) - 1))
+                / (within / (size - len(GROUPS))))
+
+
+def init_worker(values, codes, observed=None):
+    """Hands the values and group codes to a worker process once rather
+    than per batch."""
+    global _values, _codes, _observed
+    _values, _codes, _observed = values, codes, observed
+
+
+def permuted_codes(seed, size):
+    """A (size, subjects) array of the group codes, shuffled per row."""
+    rng = np.random.default_rng(seed)
+    return _codes[rng.random((size, len(_codes))).argsort(axis=1)]
+
+
+def permutation_counts(seed, size):
+    """How often each column's F under permutation reaches the observed
+    F, in one batch."""
+    statistics = f_statistics(_values, permuted_codes(seed, size))
+    return (statistics >= _observed).sum(axis=0)
+
+
+def permutation_maxima(seed, size):
+    """The largest F over the columns of each permutation in one batch."""
+    statistics = f_statistics(_values, permuted_codes(seed, size))
+    return np.nan_to_num(statistics, nan=0).max(axis=1)
+
+
+def bootstrap_means(seed, size):
+    """Resamples the subjects of each group with replacement. Returns a
+    (size, groups, columns) array of the resampled group means."""
+
+    rng = np.random.default_rng(seed)
+    means = np.empty((size, len(GROUPS), _values.shape[1]))
+    for code in range(len(GROUPS)):
+        members = _values[_codes == code]
+        # How many times each subject is drawn, then the mean as a product.
+        counts = rng.multinomial(len(members),
+                                 np.full(len(members), 1 / len(members)),
+                                 size)
+        means[:, code] = counts @ members / len(members)
+    return means
+
+
+def run_batches(function, tasks, workers, initargs):
+    """Runs function over (seed, size) tasks, in order."""
+    if workers == 1:
+        init_worker(*initargs)
+        return [function(*task) for task in tasks]
+    with multiprocessing.Pool(workers, initializer=init_worker,
+                              initargs=initargs) as pool:
+        return pool.starmap(function, tasks)
+
+
+def resample_groups(values, labels, resamples=RESAMPLES, seed=1,
+                    alpha=ALPHA, workers=None, batch_size=BATCH_SIZE):
+    """Bootstrap and permutation results for every column of a
+    (subjects, columns) array. Returns a (columns, TABLE_COLUMNS) array:
+    each group's mean and percentile confidence interval, the F statistic
+    and its permutation p-value, and 1 for each pair whose difference in
+    means has a confidence interval excluding 0."""
+
+    codes, members = group_codes(labels)
+    values = np.asarray(values, dtype=float)[members]
+    observed = f_statistics(values, codes[np.newaxis])[0]
+    bootstrap_seed, permutation_seed = np.random.SeedSequence(seed).spawn(2)
+    workers = workers or multiprocessing.cpu_count()
+    initargs = (values, codes, observed)
+
+    means = np.concatenate(run_batches(
+        bootstrap_means, batch_seeds(bootstrap_seed, resamples, batch_size),
+        workers, initargs))
+    counts = sum(run_batches(
+        permutation_counts,
+        batch_seeds(permutation_seed, resamples, batch_size), workers,
+        initargs))
+    p_value = (counts + 1) / (resamples + 1)
+
+    quantiles = [alpha / 2, 1 - alpha / 2]
+    columns = []
+    for code in range(len(GROUPS)):
+        low, high = np.quantile(means[:, code], quantiles, axis=0)
+        columns += [values[codes == code].mean(axis=0), low, high]
+    columns += [observed, p_value]
+    for first, second in PAIRS.values():
+        low, high = np.quantile(means[:, first] - means[:, second],
+                                quantiles, axis=0)
+        columns.append(((low > 0) | (high < 0)).astype(int))
+    return np.column_stack(columns)
+
+
+def resampling_table(trials, variable_list, biomech_variable_type_list,
+                     resamples=RESAMPLES, seed=1, alpha=ALPHA, workers=None):
+    """create_table's rows with bootstrap confidence intervals of the group
+    means and permutation p-values in place of the parametric tests."""
+
+    variables = list(variable_list)
+    features = list(biomech_variable_type_list)
+    values, group_columns = row_values(trials, variables, features)
+    results = np.empty((len(variables), len(TABLE_COLUMNS)))
+    for group_column in np.unique(group_columns):
+        rows = group_columns == group_column
+        results[rows] = resample_groups(values[:, rows],
+                                        trials.metadata[group_column],
+                                        resamples, seed, alpha, workers)
+
+    table = pd.DataFrame(results, columns=TABLE_COLUMNS,
+                         index=pd.MultiIndex.from_arrays(
+                             [variables, features],
+                             names=['variable', 'feature']))
+    table = table.round({column: 2 for column in TABLE_COLUMNS[:10]}
+                        | {'p_value': 5})
+    return table.astype({pair: int for pair in PAIRS})
+
+
+def curve_comparison(trials, variable, permutations=RESAMPLES, seed=1,
+                     alpha=ALPHA, workers=None, batch_size=BATCH_SIZE):
+    """Compares the footstrike groups at every point of a variable's curve.
+    Returns a DataFrame indexed by PercGcycle with the F statistic, the
+    critical F over the whole curve, the p-value corrected for the whole
+    curve and whether the point differs."""
+
+    group_column = '{}FSI{}'.format(trials.side, trials.speed_of(variable))
+    codes, members = group_codes(trials.metadata[group_column])
+    values = np.asarray(trials.variable(variable), dtype=float)[members]
+    observed = f_statistics(values, codes[np.newaxis])[0]
+    workers = workers or multiprocessing.cpu_count()
+
+    maxima = np.concatenate(run_batches(
+        permutation_maxima, batch_seeds(seed, permutations, batch_size),
+        workers, (values, codes)))
+    critical = np.quantile(maxima, 1 - alpha)
+    exceeding = (maxima[:, np.newaxis] >= observed).sum(axis=0)
+    curve = pd.DataFrame({'F': observed, 'critical_F': critical,
+                          'p_value': (exceeding + 1) / (permutations + 1)},
+                         index=pd.Index(trials.percent, name='PercGcycle'))
+    curve['significant'] = curve['F'] > critical
+    return curve
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Resampling tests of footstrike differences.')
+    parser.add_argument('--data', default=DATA_DIR,
+                        help='directory of RBDSinfo.txt and processed_data')
+    parser.add_argument('--speeds', nargs='+', default=['35'])
+    parser.add_argument('--side', default='R', choices=['R', 'L'])
+    parser.add_argument('--variables', nargs='+', default=[])
+    parser.add_argument('--features', nargs='+', default=[],
+                        choices=FEATURES, help='one per variable')
+    parser.add_argument('--curve', help='variable to compare over the whole '
+                                        'gait cycle')
+    parser.add_argument('--resamples', type=int, default=RESAMPLES)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--workers', type=int)
+    args = parser.parse_args()
+
+    if len(args.variables) != len(args.features):
+        print('Give one feature per variable.')
+        return
+    trials = load_trials(args.data, args.speeds, args.side)
+
+    if args.variables:
+        start = time.perf_counter()
+        table = resampling_table(trials, args.variables, args.features,
+                                 args.resamples, args.seed,
+                                 workers=args.workers)
+        print(table.to_string())
+        print('{} rows, {} resamples in {:.2f} s'.format(
+            len(table), args.resamples, time.perf_counter() - start))
+
+    if args.curve:
+        start = time.perf_counter()
+        curve = curve_comparison(trials, args.curve, args.resamples,
+                                 args.seed, workers=args.workers)
+        significant = curve.index[curve['significant']]
+        print('{}: critical F {:.2f}, {} of {} points differ'.format(
+            args.curve, curve['critical_F'].iloc[0], len(significant),
+            len(curve)), list(significant))
+        print('{} permutations in {:.2f} s'.format(
+            args.resamples, time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main()
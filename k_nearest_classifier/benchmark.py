@@ -0,0 +1,97 @@
+"""Compares the classifier's neighbour search backends on synthetic data.
+
+    python benchmark.py --sizes 10000 100000 1000000 --queries 1000
+
+Each dataset holds clusters of labelled points in a unit hypercube. For
+every size and backend the time to fit and to predict the queries is
+reported, along with whether the predictions match the brute force ones.
+Every backend's neighbours are then compared on duplicated points, where
+many distances tie and must be broken by training point index.
+"""
+import argparse
+import time
+import numpy as np
+from knn import BACKENDS, K_nearest_classifier
+
+
+def synthetic_data(size, dimensions, categories, rng):
+    """Points scattered around one random centre per category."""
+    centres = rng.random((categories, dimensions))
+    labels = rng.integers(0, categories, size)
+    data = centres[labels] + rng.normal(0, 0.15, (size, dimensions))
+    return data, labels
+
+
+def duplicated_data(size, dimensions, copies, rng):
+    """Points on a small integer grid, each repeated copies times in a random
+    order, so many neighbours lie at exactly the same distance."""
+    points = rng.integers(0, 4, (size // copies, dimensions)).astype(float)
+    data = np.repeat(points, copies, axis=0)
+    return data[rng.permutation(len(data))]
+
+
+def tie_check(backends, size, dimensions, queries, k, rng):
+    """Whether each backend finds the same neighbours, in the same order,
+    as the first on duplicated points."""
+    data = duplicated_data(size, dimensions, 3, rng)
+    test_data = duplicated_data(queries, dimensions, 1, rng)
+    neighbours = {}
+    for backend in backends:
+        classifier = K_nearest_classifier(backend)
+        classifier.fit(data, np.zeros(len(data), dtype=int))
+        neighbours[backend] = classifier.kneighbors(test_data, k)[1]
+    reference = neighbours[backends[0]]
+    return {backend: np.array_equal(indices, reference)
+            for backend, indices in neighbours.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Times each nearest neighbour backend.')
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[10000, 100000, 1000000])
+    parser.add_argument('--dimensions', type=int, default=4)
+    parser.add_argument('--categories', type=int, default=3)
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--backends', nargs='+', default=list(BACKENDS),
+                        choices=list(BACKENDS))
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    print('{:>9} {:>10} {:>9} {:>11} {:>12} {:>8}'.format(
+        'size', 'backend', 'fit (s)', 'predict (s)', 'queries/s', 'matches'))
+    for size in args.sizes:
+        data, labels = synthetic_data(size + args.queries, args.dimensions,
+                                      args.categories, rng)
+        train_data, test_data = data[:size], data[size:]
+        train_labels = labels[:size]
+
+        reference = None
+        for backend in args.backends:
+            classifier = K_nearest_classifier(backend)
+            start = time.perf_counter()
+            classifier.fit(train_data, train_labels)
+            fitted = time.perf_counter()
+            predictions = classifier.predict(test_data, args.k)
+            finished = time.perf_counter()
+
+            if reference is None:
+                reference = predictions
+            print('{:>9} {:>10} {:>9.3f} {:>11.3f} {:>12.0f} {:>7.1%}'.format(
+                size, backend, fitted - start, finished - fitted,
+                len(test_data) / (finished - fitted),
+                np.mean(predictions == reference)))
+
+    matches = tie_check(args.backends, min(args.sizes), args.dimensions,
+                        args.queries, args.k, rng)
+    print()
+    print('Neighbours of duplicated points match {}: {}'.format(
+        args.backends[0], ', '.join(
+            '{} {}'.format(backend, 'yes' if match else 'no')
+            for backend, match in matches.items())))
+
+
+if __name__ == '__main__':
+    main()
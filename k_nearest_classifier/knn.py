@@ -0,0 +1,355 @@
+"""The K-Nearest Neighbours classifier from Notebook.ipynb as an importable
+module, with three ways of finding each point's nearest neighbours:
+
+    'brute'      every distance, computed block by block with NumPy
+    'kd_tree'    a k-d tree of axis-aligned bounding boxes
+    'ball_tree'  a ball tree of bounding spheres
+
+    from knn import K_nearest_classifier, normalise, train_test_split
+
+    classifier = K_nearest_classifier(backend='kd_tree')
+    classifier.fit(train_data, train_labels)
+    classifier.score(test_data, test_labels, 5)
+"""
+import random
+import numpy as np
+
+DEFAULT_CHUNK_SIZE = 1 << 20
+DEFAULT_LEAF_SIZE = 256
+TEST_BLOCK = 256
+# Slack on the trees' squared distance bounds, relative to the data's scale.
+TIE_TOLERANCE = 1e-9
+
+
+def normalise(data):
+    """Min-max normalising every column at once. Columns holding a single
+    value are set to zero rather than divided by zero."""
+
+    data = np.asarray(data, dtype=float)
+    minimum = data.min(axis=0)
+    spread = data.max(axis=0) - minimum
+    spread[spread == 0] = 1
+    return (data - minimum) / spread
+
+
+def train_test_split(data, labels, train_fraction=0.75, seed=None):
+    """Creating two randomly selected groups split 75/25,
+        for training and testing respectively. Without a seed the shuffle
+        uses the random module's global state, as in the notebook."""
+
+    # Creating a randomly ordered range the length of the data.
+    indices = list(range(len(data)))
+    if seed is None:
+        random.shuffle(indices)
+    else:
+        random.Random(seed).shuffle(indices)
+    split = int(len(data) * train_fraction)
+
+    # Selecting the first 75% of the randomly ordered data.
+    train_data = data[indices[:split]]
+    train_labels = labels[indices[:split]]
+
+    # Selecting the remaining 25%.
+    test_data = data[indices[split:]]
+    test_labels = labels[indices[split:]]
+
+    return train_data, test_data, train_labels, test_labels
+
+
+def squared_distances(points_1, points_2, norms_2=None):
+    """Squared euclidean distances between two sets of points, using
+    |a - b|^2 = |a|^2 - 2a.b + |b|^2 so the work is one matrix product."""
+
+    if norms_2 is None:
+        norms_2 = np.einsum('ij,ij->i', points_2, points_2)
+    distances = points_1 @ points_2.T
+    distances *= -2
+    distances += np.einsum('ij,ij->i', points_1, points_1)[:, np.newaxis]
+    distances += norms_2
+    return np.maximum(distances, 0, out=distances)
+
+
+def nearest_k(distances, indices, k):
+    """Keeps the k smallest distances of each row, ties at the k-th distance
+    going to the lowest indices. Rows are left unordered."""
+
+    if distances.shape[1] <= k:
+        return distances, indices
+    nearest = np.argpartition(distances, k - 1, axis=1)
+    kth = np.take_along_axis(distances, nearest[:, k - 1:k], axis=1)
+    # argpartition splits ties at the k-th distance arbitrarily, so rows
+    # leaving out a tied candidate are cut again: nearer candidates first,
+    # then the tied ones by index.
+    left_out = np.take_along_axis(distances, nearest[:, k:], axis=1)
+    tied = (left_out == kth).any(axis=1)
+    nearest = nearest[:, :k]
+    if tied.any():
+        keys = np.where(distances[tied] < kth[tied], -np.inf,
+                        np.where(distances[tied] == kth[tied],
+                                 indices[tied], np.inf))
+        nearest[tied] = np.argpartition(keys, k - 1, axis=1)[:, :k]
+    return (np.take_along_axis(distances, nearest, axis=1),
+            np.take_along_axis(indices, nearest, axis=1))
+
+
+def merge_nearest(best_distances, best_indices, distances, indices, k):
+    """Keeps the k smallest distances of each row out of the current best
+    and a block of new candidates, as nearest_k. Rows are left unordered."""
+
+    # Cutting a wide block down to its own k best before joining the two.
+    distances, indices = nearest_k(distances, indices, k)
+    return nearest_k(np.concatenate([best_distances, distances], axis=1),
+                     np.concatenate([best_indices, indices], axis=1), k)
+
+
+def sort_neighbours(distances, indices):
+    """Orders each row by distance, ties by training point index."""
+    order = np.lexsort((indices, distances), axis=1)
+    return (np.take_along_axis(distances, order, axis=1),
+            np.take_along_axis(indices, order, axis=1))
+
+
+class BruteForce:
+    """Finds neighbours by computing every distance. Distances are computed a
+    block of test points against a block of training points at a time, no
+    block larger than chunk_size values, and only each test point's k best
+    are kept between blocks, so memory use does not grow with the data."""
+
+    def __init__(self, data, chunk_size=DEFAULT_CHUNK_SIZE, **kwargs):
+        self.data = np.ascontiguousarray(data, dtype=float)
+        self.norms = np.einsum('ij,ij->i', self.data, self.data)
+        self.chunk_size = chunk_size
+
+    def query(self, points, k):
+        """Returns the squared distances and indices of each point's k
+        nearest training points, nearest first."""
+
+        points = np.ascontiguousarray(points, dtype=float)
+        test_block = min(len(points), TEST_BLOCK, self.chunk_size) or 1
+        train_block = max(1, self.chunk_size // test_block)
+        distances = np.empty((len(points), k))
+        indices = np.empty((len(points), k), dtype=np.int64)
+
+        for start in range(0, len(points), test_block):
+            block = points[start:start + test_block]
+            best_distances = np.full((len(block), 0), np.inf)
+            best_indices = np.empty((len(block), 0), dtype=np.int64)
+            for train_start in range(0, len(self.data), train_block):
+                train_stop = train_start + train_block
+                block_distances = squared_distances(
+                    block, self.data[train_start:train_stop],
+                    self.norms[train_start:train_stop])
+                block_indices = np.broadcast_to(
+                    np.arange(train_start, train_start
+                              + block_distances.shape[1]),
+                    block_distances.shape)
+                best_distances, best_indices = merge_nearest(
+                    best_distances, best_indices, block_distances,
+                    block_indices, k)
+            distances[start:start + test_block] = best_distances
+            indices[start:start + test_block] = best_indices
+        return sort_neighbours(distances, indices)
+
+
+class SpaceTree:
+    """Shared building and searching for the k-d tree and ball tree.
+
+    Nodes are split in two at the median of the dimension with the widest
+    spread until they hold at most leaf_size points. Training points are
+    reordered so every node covers a contiguous slice of them.
+
+    Searches walk the tree with all test points at once: at each node the
+    points whose current k-th nearest distance is closer than the node's
+    bounds are dropped, and the rest carry on to the children, nearer child
+    first. Subclasses give each node its bounds and a lower bound on the
+    distance from a point to anything inside them."""
+
+    def __init__(self, data, leaf_size=DEFAULT_LEAF_SIZE, **kwargs):
+        data = np.asarray(data, dtype=float)
+        self.leaf_size = max(1, leaf_size)
+        self.order = np.arange(len(data))
+        self.starts, self.stops, self.children = [], [], []
+        self.bounds = []
+
+        # Building breadth first, each node's slice is partitioned in place.
+        self._add_node(data, 0, len(data))
+        node = 0
+        while node < len(self.starts):
+            start, stop = self.starts[node], self.stops[node]
+            if stop - start > self.leaf_size:
+                points = data[self.order[start:stop]]
+                dimension = np.argmax(points.max(axis=0)
+                                      - points.min(axis=0))
+                middle = (stop - start) // 2
+                split = np.argpartition(points[:, dimension], middle)
+                self.order[start:stop] = self.order[start:stop][split]
+                left = self._add_node(data, start, start + middle)
+                right = self._add_node(data, start + middle, stop)
+                self.children[node] = (left, right)
+            node += 1
+
+        self.data = np.ascontiguousarray(data[self.order])
+        self.norms = np.einsum('ij,ij->i', self.data, self.data)
+        self.tolerance = TIE_TOLERANCE * np.abs(data).max(initial=0) ** 2
+        self._finish_bounds()
+
+    def _add_node(self, data, start, stop):
+        self.starts.append(start)
+        self.stops.append(stop)
+        self.children.append(None)
+        self.bounds.append(self._node_bounds(data[self.order[start:stop]]))
+        return len(self.starts) - 1
+
+    def _node_bounds(self, points):
+        raise NotImplementedError
+
+    def _finish_bounds(self):
+        pass
+
+    def min_distances(self, node, points):
+        """Squared lower bounds on the distance from each point to the
+        training points under a node."""
+        raise NotImplementedError
+
+    def query(self, points, k):
+        """Returns the squared distances and indices of each point's k
+        nearest training points, nearest first."""
+
+        self._points = np.ascontiguousarray(points, dtype=float)
+        self._distances = np.full((len(points), k), np.inf)
+        self._indices = np.full((len(points), k), -1, dtype=np.int64)
+        self._k = k
+        try:
+            self._search(0, np.arange(len(points)))
+            distances, indices = self._distances, self._indices
+        finally:
+            del self._points, self._distances, self._indices
+        return sort_neighbours(distances, indices)
+
+    def _search(self, node, queries):
+        # Dropping points that already have k neighbours nearer than the node.
+        # A node as near as the k-th neighbour may hold a tie with a lower
+        # index, so it is still searched, allowing for bounds and distances
+        # being rounded differently.
+        limits = self._distances[queries].max(axis=1) + self.tolerance
+        queries = queries[self.min_distances(node, self._points[queries])
+                          <= limits]
+        if len(queries) == 0:
+            return
+
+        if self.children[node] is None:
+            start, stop = self.starts[node], self.stops[node]
+            distances = squared_distances(self._points[queries],
+                                          self.data[start:stop],
+                                          self.norms[start:stop])
+            # Training point indices rather than tree positions, so ties
+            # are broken the same way as by the other backends.
+            indices = np.broadcast_to(self.order[start:stop],
+                                      distances.shape)
+            (self._distances[queries],
+             self._indices[queries]) = merge_nearest(
+                self._distances[queries], self._indices[queries],
+                distances, indices, self._k)
+            return
+
+        # Visiting the nearer child first tightens the limits sooner.
+        left, right = self.children[node]
+        points = self._points[queries]
+        left_first = (self.min_distances(left, points)
+                      <= self.min_distances(right, points))
+        self._search(left, queries[left_first])
+        self._search(right, queries[~left_first])
+        self._search(right, queries[left_first])
+        self._search(left, queries[~left_first])
+
+
+class KDTree(SpaceTree):
+    """A k-d tree bounding each node by the box around its points."""
+
+    def _node_bounds(self, points):
+        return points.min(axis=0), points.max(axis=0)
+
+    def _finish_bounds(self):
+        self.lower = np.array([lower for lower, upper in self.bounds])
+        self.upper = np.array([upper for lower, upper in self.bounds])
+
+    def min_distances(self, node, points):
+        outside = (np.maximum(self.lower[node] - points, 0)
+                   + np.maximum(points - self.upper[node], 0))
+        return np.einsum('ij,ij->i', outside, outside)
+
+
+class BallTree(SpaceTree):
+    """A ball tree bounding each node by a sphere around its centroid. Unlike
+    boxes, spheres stay tight as the number of dimensions grows."""
+
+    def _node_bounds(self, points):
+        centre = points.mean(axis=0)
+        radius = np.sqrt(((points - centre) ** 2).sum(axis=1).max())
+        return centre, radius
+
+    def _finish_bounds(self):
+        self.centres = np.array([centre for centre, radius in self.bounds])
+        self.radii = np.array([radius for centre, radius in self.bounds])
+
+    def min_distances(self, node, points):
+        offset = points - self.centres[node]
+        gap = np.sqrt(np.einsum('ij,ij->i', offset, offset)) - self.radii[node]
+        return np.maximum(gap, 0) ** 2
+
+
+BACKENDS = {'brute': BruteForce, 'kd_tree': KDTree, 'ball_tree': BallTree}
+
+
+class K_nearest_classifier():
+    """Classifies each point by a majority vote of its k nearest training
+    points. backend is one of 'brute', 'kd_tree' or 'ball_tree'; chunk_size
+    limits the distance blocks of 'brute' and leaf_size the leaves of the
+    trees."""
+
+    def __init__(self, backend='brute', chunk_size=DEFAULT_CHUNK_SIZE,
+                 leaf_size=DEFAULT_LEAF_SIZE):
+        if backend not in BACKENDS:
+            raise ValueError('Unknown backend {!r}, expected one of {}'.format(
+                backend, ', '.join(BACKENDS)))
+        self.backend = backend
+        self.chunk_size = chunk_size
+        self.leaf_size = leaf_size
+
+    def fit(self, train_data, train_labels):
+        """Inputing training data, building the backend's index."""
+        self.train_data = np.asarray(train_data, dtype=float)
+        self.train_labels = np.asarray(train_labels)
+        self.index = BACKENDS[self.backend](self.train_data,
+                                            chunk_size=self.chunk_size,
+                                            leaf_size=self.leaf_size)
+
+    def kneighbors(self, test_data, k):
+        """Returns the distances and training indices of each test point's k
+        nearest neighbours, nearest first."""
+        k = min(k, len(self.train_data))
+        distances, indices = self.index.query(test_data, k)
+        return np.sqrt(distances), indices
+
+    def vote(self, neighbour_labels):
+        """Returns the most common label of each row of neighbour labels,
+        the lowest label winning ties."""
+
+        # Counting each row's labels in one flat bincount.
+        num_categories = int(self.train_labels.max()) + 1
+        rows = np.arange(len(neighbour_labels))[:, np.newaxis]
+        count = np.bincount((rows * num_categories
+                             + neighbour_labels).ravel(),
+                            minlength=len(neighbour_labels) * num_categories)
+        return count.reshape(-1, num_categories).argmax(axis=1)
+
+    def predict(self, test_data, k):
+        """Predict the classifications of a set of data."""
+        distances, indices = self.kneighbors(test_data, k)
+        return self.vote(self.train_labels[indices])
+
+    def score(self, test_data, test_labels, k):
+        """Outputs the decimal percentage of labels correctly
+            predicted by the classifier."""
+        predictions = self.predict(test_data, k)
+        return round(float(np.mean(predictions == np.asarray(test_labels))), 3)
@@ -0,0 +1,159 @@
+"""Choosing k for the K-Nearest Neighbours classifier by k-fold cross
+validation.
+
+    python model_selection.py --data iris.csv --folds 5 --k-max 30
+
+Each fold's nearest neighbours are found once, up to the largest k, and every
+k is scored from that one ordering, so sweeping k costs little more than a
+single prediction. Folds run in parallel on a process pool. Fold membership
+comes from a seeded shuffle and ties are broken by label, so results are the
+same for the same seed whatever the number of workers.
+"""
+import argparse
+import multiprocessing
+import random
+import time
+import numpy as np
+import pandas as pd
+from knn import BACKENDS, K_nearest_classifier, normalise, train_test_split
+
+_data = None
+_labels = None
+
+
+def k_fold_indices(size, folds, seed):
+    """Shuffles the row indices with the seed and splits them into folds of
+    near equal size."""
+    indices = list(range(size))
+    random.Random(seed).shuffle(indices)
+    return np.array_split(np.array(indices), folds)
+
+
+def sweep_predictions(neighbour_labels, ks, num_categories):
+    """Predicts with every k at once from neighbour labels ordered nearest
+    first. Returns a (points, len(ks)) array, the lowest label winning ties
+    as in K_nearest_classifier.vote."""
+
+    # Running label counts over the first 1, 2, 3... neighbours.
+    one_hot = neighbour_labels[:, :, np.newaxis] == np.arange(num_categories)
+    counts = np.cumsum(one_hot, axis=1, dtype=np.int32)
+    return counts[:, np.asarray(ks) - 1].argmax(axis=2)
+
+
+def init_worker(data, labels):
+    """Hands the dataset to a worker process once rather than per fold."""
+    global _data, _labels
+    _data, _labels = data, labels
+
+
+def score_fold(fold, test_indices, ks, backend):
+    """Fits on every row outside the fold and scores each k on the fold.
+    Returns the fold, its accuracies and its timings in seconds."""
+
+    start = time.perf_counter()
+    train = np.ones(len(_data), dtype=bool)
+    train[test_indices] = False
+    classifier = K_nearest_classifier(backend)
+    classifier.fit(_data[train], _labels[train])
+    fitted = time.perf_counter()
+
+    distances, indices = classifier.kneighbors(_data[test_indices], max(ks))
+    searched = time.perf_counter()
+
+    num_categories = int(classifier.train_labels.max()) + 1
+    predictions = sweep_predictions(classifier.train_labels[indices], ks,
+                                    num_categories)
+    accuracies = (predictions
+                  == _labels[test_indices][:, np.newaxis]).mean(axis=0)
+    scored = time.perf_counter()
+    return fold, accuracies, {'fit': fitted - start,
+                              'neighbours': searched - fitted,
+                              'scoring': scored - searched}
+
+
+def cross_validate(data, labels, ks=range(1, 31), folds=5, seed=1,
+                   backend='kd_tree', workers=None):
+    """Scores every k on every fold. Returns a DataFrame of accuracies with
+    a row per fold and a column per k, and a DataFrame of each fold's fit,
+    neighbour search and scoring times."""
+
+    ks = list(ks)
+    data = np.asarray(data, dtype=float)
+    labels = np.asarray(labels)
+    tasks = [(fold, test_indices, ks, backend) for fold, test_indices
+             in enumerate(k_fold_indices(len(data), folds, seed))]
+
+    workers = workers or min(folds, multiprocessing.cpu_count())
+    if workers == 1:
+        init_worker(data, labels)
+        results = [score_fold(*task) for task in tasks]
+    else:
+        with multiprocessing.Pool(workers, initializer=init_worker,
+                                  initargs=(data, labels)) as pool:
+            results = pool.starmap(score_fold, tasks)
+
+    results.sort(key=lambda result: result[0])
+    scores = pd.DataFrame([accuracies for fold, accuracies, times in results],
+                          columns=pd.Index(ks, name='k'))
+    scores.index.name = 'fold'
+    timings = pd.DataFrame([times for fold, accuracies, times in results])
+    timings.index.name = 'fold'
+    return scores, timings
+
+
+def read_dataset(path):
+    """Reads a CSV whose last column holds the labels, numbering the labels
+    by their sorted order as the notebook does for the iris species."""
+    dataset = pd.read_csv(path)
+    labels = pd.Categorical(dataset.iloc[:, -1]).codes.astype(np.int64)
+    return dataset.iloc[:, :-1].to_numpy(dtype=float), labels
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Chooses k by k-fold cross validation.')
+    parser.add_argument('--data', help='CSV with the label as last column, '
+                                       'synthetic clusters when omitted')
+    parser.add_argument('--size', type=int, default=100000,
+                        help='number of synthetic points')
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--k-max', type=int, default=30)
+    parser.add_argument('--backend', default='kd_tree',
+                        choices=list(BACKENDS))
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    if args.data:
+        data, labels = read_dataset(args.data)
+    else:
+        rng = np.random.default_rng(args.seed)
+        centres = rng.random((3, 4))
+        labels = rng.integers(0, 3, args.size)
+        data = centres[labels] + rng.normal(0, 0.15, (args.size, 4))
+
+    # Holding out a test set, then choosing k on the rest.
+    data = normalise(data)
+    train_data, test_data, train_labels, test_labels = train_test_split(
+        data, labels, seed=args.seed)
+    start = time.perf_counter()
+    scores, timings = cross_validate(train_data, train_labels,
+                                     range(1, args.k_max + 1), args.folds,
+                                     args.seed, args.backend, args.workers)
+    seconds = time.perf_counter() - start
+
+    print(timings.round(3).to_string())
+    mean = scores.mean()
+    best_k = int(mean.idxmax())
+    print('Cross validated {} folds x {} values of k in {:.2f} s'.format(
+        args.folds, len(mean), seconds))
+    print('Best k: {} (mean accuracy {:.3f})'.format(best_k, mean[best_k]))
+
+    classifier = K_nearest_classifier(args.backend)
+    classifier.fit(train_data, train_labels)
+    print('Held out score: {}'.format(
+        classifier.score(test_data, test_labels, best_k)))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,6 @@
 from PyQt5 import QtCore, QtGui, QtWidgets
-from PyQt5.QtWidgets import (QLineEdit, QVBoxLayout, QTableWidget, QLabel)
+from PyQt5.QtWidgets import (QLineEdit, QVBoxLayout, QTableView, QLabel,
+                             QHeaderView)
 
        
 class Ui_MainWindow(object):
@@ -76,6 +77,16 @@ class Ui_MainWindow(object):
         self.diary_btn.setFont(font)
         self.diary_btn.setObjectName("diary_btn")
         
+        self.suggest_btn = QtWidgets.QPushButton(self.centralwidget)
+        self.suggest_btn.setGeometry(QtCore.QRect(242, 10, 89, 25))
+        self.suggest_btn.setFont(font)
+        self.suggest_btn.setObjectName("suggest_btn")
+        
+        self.similar_btn = QtWidgets.QPushButton(self.centralwidget)
+        self.similar_btn.setGeometry(QtCore.QRect(548, 10, 89, 25))
+        self.similar_btn.setFont(font)
+        self.similar_btn.setObjectName("similar_btn")
+        
         self.gram_text = QtWidgets.QLabel(self.centralwidget)
         self.gram_text.setText('Amount (g):')
         self.gram_text.setGeometry(QtCore.QRect(645, 10, 150, 25))
@@ -118,22 +129,33 @@ class Ui_MainWindow(object):
         self.table_pg = QtWidgets.QWidget()
         self.table_pg.setObjectName('table_pg')
         mainLayout = QVBoxLayout()
-        self.table = QTableWidget(30, 2)
+        self.table_search_field = QLineEdit()
+        self.table_search_field.setStyleSheet('font-size: 15px; height: 20px')
+        mainLayout.addWidget(self.table_search_field)
+        self.table = QTableView()
         self.table.horizontalHeader().setVisible(False)
         self.table.verticalHeader().setVisible(False)
-        self.table.setColumnWidth(0, 749)
-        self.table.setColumnWidth(1, 52)
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.table.verticalHeader().setDefaultSectionSize(25)
         self.table.setStyleSheet('font-size: 13px')
         mainLayout.addWidget(self.table)
         self.table_pg.setLayout(mainLayout)
+    
+    def set_table_model(self, model):
+        # Column widths can only be set once the view has a model.
+        self.table.setModel(model)
+        self.table.setColumnWidth(0, 749)
+        self.table.setColumnWidth(1, 52)
         self.stackedWidget.addWidget(self.table_pg)
 
     def hide_righthand_widgets(self):
+        self.similar_btn.hide()
         self.plus_btn.hide()
         self.gram_text.hide()
         self.gram_field.hide()
         
     def show_righthand_widgets(self):
+        self.similar_btn.show()
         self.plus_btn.show()
         self.gram_text.show()
         self.gram_field.show()
@@ -145,3 +167,5 @@ class Ui_MainWindow(object):
         self.plus_btn.setText(_translate("MainWindow", "+"))
         self.search_btn.setText(_translate("MainWindow", "Search"))
         self.diary_btn.setText(_translate("MainWindow", "Diary"))
+        self.suggest_btn.setText(_translate("MainWindow", "Suggest"))
+        self.similar_btn.setText(_translate("MainWindow", "Similar"))
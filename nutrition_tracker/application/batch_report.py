@@ -0,0 +1,197 @@
+"""Headless batch nutrition reports.
+
+Reads a file of meal logs for many users and writes each user's daily RDI
+coverage to CSV or Parquet, optionally with a PNG chart per user and day.
+
+    python batch_report.py meals.csv report.csv --workers 4 --charts charts/
+
+Meal logs are a CSV with one row per entry and the columns user_id, sex
+('Male' or 'Female'), weight (kg), date, food_id and grams, or a JSON lines
+file with one user per line:
+
+    {"user_id": 1, "sex": "Female", "weight": 60,
+     "entries": [{"date": "2021-05-01", "food_id": 12, "grams": 150}, ...]}
+
+Work is split across a process pool. Each worker opens the memory-mapped
+food store itself, so the nutrient matrix is shared through the page cache
+rather than pickled to every process.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import time
+import matplotlib
+matplotlib.use('Agg')
+import numpy as np
+import pandas as pd
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+import nutrition_plotter
+from nutrition_plotter import (CHART_DPI, CHART_SIZE, NutritionChart,
+                               create_plot_vars, get_food_store, get_rdi_df,
+                               get_rdi_profile)
+
+MEAL_COLUMNS = ['user_id', 'sex', 'weight', 'date', 'food_id', 'grams']
+
+_chart = None
+
+
+def read_meal_logs(path):
+    """Reads meal logs from CSV or JSON lines into one row per entry."""
+
+    if os.path.splitext(path)[1] in ('.jsonl', '.json'):
+        rows = []
+        with open(path) as file:
+            for line in file:
+                if not line.strip():
+                    continue
+                user = json.loads(line)
+                for entry in user['entries']:
+                    rows.append([user['user_id'], user['sex'], user['weight'],
+                                 entry['date'], entry['food_id'],
+                                 entry['grams']])
+        meals = pd.DataFrame(rows, columns=MEAL_COLUMNS)
+    else:
+        meals = pd.read_csv(path, usecols=MEAL_COLUMNS)
+    meals['date'] = pd.to_datetime(meals['date']).dt.date
+    return meals
+
+
+def split_users(meals, n_chunks):
+    """Splits the meal logs into chunks, keeping each user in one chunk."""
+
+    users = meals['user_id'].unique()
+    chunk_of_user = pd.Series(np.arange(len(users)) % n_chunks, index=users)
+    chunk = meals['user_id'].map(chunk_of_user).to_numpy()
+    return [meals[chunk == number] for number in range(n_chunks)
+            if (chunk == number).any()]
+
+
+def init_worker(data_path):
+    """Points each worker process at the dataset, which it maps itself."""
+    nutrition_plotter.DATA_PATH = data_path
+
+
+def report_chunk(meals, chart_dir=None):
+    """Sums each user's entries per day and returns their RDI coverage."""
+
+    store = get_food_store()
+    days = meals.groupby(['user_id', 'date'], sort=True)
+    day_index = days.ngroup().to_numpy()
+    first = days.head(1).sort_values(['user_id', 'date'])
+
+    amounts = np.nan_to_num(np.asarray(
+        store.nutrients[meals['food_id'].to_numpy()], dtype=float))
+    amounts *= (meals['grams'].to_numpy(dtype=float) / 100)[:, np.newaxis]
+    totals = np.zeros((days.ngroups, len(store.nutrient_names)))
+    np.add.at(totals, day_index, amounts)
+
+    # Days are scored a profile at a time so each profile is built once.
+    percent = np.empty_like(totals)
+    profiles = first[['sex', 'weight']].to_numpy()
+    for sex, weight in set(map(tuple, profiles)):
+        rows = (profiles[:, 0] == sex) & (profiles[:, 1] == weight)
+        percent[rows] = get_rdi_profile(sex, weight).percentages(
+            totals[rows])[0]
+
+    report = pd.DataFrame(
+        percent, columns=[name + ' (% RDI)' for name in store.nutrient_names])
+    report.insert(0, 'user_id', first['user_id'].to_numpy())
+    report.insert(1, 'date', first['date'].to_numpy())
+    report.insert(2, 'sex', first['sex'].to_numpy())
+    report.insert(3, 'weight', first['weight'].to_numpy())
+
+    if chart_dir is not None:
+        for row, (user_id, date, sex, weight) in enumerate(
+                first[['user_id', 'date', 'sex', 'weight']].to_numpy()):
+            totals_series = pd.Series(totals[row], index=store.nutrient_names)
+            save_chart(os.path.join(chart_dir,
+                                    '{}_{}.png'.format(user_id, date)),
+                       totals_series, sex, weight,
+                       'User {} - {}'.format(user_id, date))
+    return report
+
+
+def save_chart(path, totals, sex, weight, title):
+    """Renders a day's totals with the Agg backend. The figure is built once
+    per process and updated for each chart."""
+
+    global _chart
+    if _chart is None:
+        fig = Figure(dpi=CHART_DPI, figsize=CHART_SIZE)
+        FigureCanvasAgg(fig)
+        _chart = NutritionChart(fig)
+    plot_vars = create_plot_vars(totals, None, None, get_rdi_df(), True, sex,
+                                 weight)
+    _chart.update(*plot_vars[:-1], title)
+    _chart.fig.savefig(path, facecolor=_chart.fig.get_facecolor())
+
+
+def run_report(meals, data_path, workers, chart_dir=None, chunks_per_worker=4):
+    """Reports on every user across a pool of worker processes."""
+
+    n_chunks = max(1, workers * chunks_per_worker)
+    chunks = split_users(meals, n_chunks)
+    if workers == 1:
+        init_worker(data_path)
+        reports = [report_chunk(chunk, chart_dir) for chunk in chunks]
+    else:
+        with multiprocessing.Pool(workers, initializer=init_worker,
+                                  initargs=(data_path,)) as pool:
+            reports = pool.starmap(report_chunk,
+                                   [(chunk, chart_dir) for chunk in chunks])
+    return pd.concat(reports, ignore_index=True).sort_values(
+        ['user_id', 'date'], ignore_index=True)
+
+
+def write_report(report, path):
+    """Writes Parquet for .parquet paths and CSV otherwise."""
+    if os.path.splitext(path)[1] == '.parquet':
+        report.to_parquet(path, index=False)
+    else:
+        report.to_csv(path, index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Writes daily RDI coverage for many users\' meal logs.')
+    parser.add_argument('meals', help='meal log CSV or JSON lines file')
+    parser.add_argument('output', help='report path, .csv or .parquet')
+    parser.add_argument('--data', default=nutrition_plotter.DATA_PATH,
+                        help='nutrition_data.csv, its store is used if built')
+    parser.add_argument('--workers', type=int,
+                        default=multiprocessing.cpu_count())
+    parser.add_argument('--charts', metavar='DIR',
+                        help='also save a PNG chart per user and day')
+    parser.add_argument('--scaling', action='store_true',
+                        help='time the report with 1, 2, 4... workers')
+    args = parser.parse_args()
+
+    # Building or checking the store once here, so workers only open it.
+    nutrition_plotter.DATA_PATH = args.data
+    get_food_store()
+    meals = read_meal_logs(args.meals)
+    n_users = meals['user_id'].nunique()
+    if args.charts:
+        os.makedirs(args.charts, exist_ok=True)
+
+    worker_counts = [args.workers]
+    if args.scaling:
+        worker_counts = sorted({2 ** power for power in
+                                range(args.workers.bit_length())
+                                if 2 ** power <= args.workers}
+                               | {args.workers})
+
+    for workers in worker_counts:
+        start = time.perf_counter()
+        report = run_report(meals, args.data, workers, args.charts)
+        seconds = time.perf_counter() - start
+        print('{} workers: {} users, {} days in {:.2f} s, '
+              '{:.1f} users/s'.format(workers, n_users, len(report), seconds,
+                                      n_users / seconds))
+    write_report(report, args.output)
+
+
+if __name__ == '__main__':
+    main()
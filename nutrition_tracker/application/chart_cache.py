@@ -0,0 +1,223 @@
+"""Rendered food charts, so foods viewed before are shown as images without
+running Matplotlib again.
+
+    python chart_cache.py --top 500 --grams 100 --sex Male --weight 70
+
+Charts are PNGs keyed by (food_id, grams, sex, weight). The most recently
+shown are kept in memory up to MEMORY_BYTES, dropping the least recently
+used first, and every chart is saved under the food store in a directory
+named after the dataset and the release deltas applied to it, so an updated
+store never shows an old chart. The most complete foods can be rendered
+ahead of time, from the command line on a process pool or by the
+application in a low priority background process.
+"""
+import argparse
+import collections
+import io
+import multiprocessing
+import os
+import threading
+import time
+import numpy as np
+import pandas as pd
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+import nutrition_plotter
+from nutrition_plotter import (CHART_DPI, CHART_SIZE, NutritionChart,
+                               create_plot_vars, get_food_store, get_rdi_df)
+
+MEMORY_BYTES = 64 << 20
+PRERENDER_FOODS = 200
+
+_chart = None
+_render_lock = threading.Lock()
+
+
+def chart_dir(store):
+    """The store's chart directory for its current data."""
+    return os.path.join(store.store_dir, 'charts', '{}-{}'.format(
+        store.meta['source_sha1'][:12], len(store.meta.get('deltas', []))))
+
+
+class ChartCache:
+    """PNG charts in memory, least recently used dropped first once they
+    pass max_bytes, and on disk in directory. Safe to use from the
+    background worker's threads."""
+
+    def __init__(self, directory, max_bytes=MEMORY_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._charts = collections.OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, '{}_{}_{}_{}.png'.format(*key))
+
+    def get(self, key):
+        """Returns the chart's PNG bytes, or None if it was never saved."""
+        with self._lock:
+            if key in self._charts:
+                self._charts.move_to_end(key)
+                return self._charts[key]
+        try:
+            with open(self.path(key), 'rb') as file:
+                png = file.read()
+        except FileNotFoundError:
+            return None
+        self._remember(key, png)
+        return png
+
+    def put(self, key, png):
+        """Saves a chart, writing it under a temporary name first so other
+        processes never read part of one."""
+        path = self.path(key)
+        temp_path = '{}.{}-{}.tmp'.format(path, os.getpid(),
+                                          threading.get_ident())
+        with open(temp_path, 'wb') as file:
+            file.write(png)
+        os.replace(temp_path, path)
+        self._remember(key, png)
+
+    def _remember(self, key, png):
+        with self._lock:
+            if key in self._charts:
+                self._bytes -= len(self._charts.pop(key))
+            self._charts[key] = png
+            self._bytes += len(png)
+            while self._bytes > self.max_bytes and len(self._charts) > 1:
+                self._bytes -= len(self._charts.popitem(last=False)[1])
+
+
+def store_plot_vars(store, food_id, grams, sex, weight):
+    """create_plot_vars for one food read straight from the store, without
+    building the food DataFrame."""
+    food_series = pd.Series(store.nutrients[food_id].astype(float),
+                            index=store.nutrient_names) / 100 * grams
+    plot_vars = create_plot_vars(food_series, None, None, get_rdi_df(), True,
+                                 sex, weight)
+    return plot_vars[:-1] + (store.description(food_id),)
+
+
+def render_png(plot_vars):
+    """Renders create_plot_vars outputs with the Agg backend, at the size
+    of the application's Canvas at one pixel per point whatever the screen's
+    scaling. The figure is built once per process and shared, so calls from
+    several threads take turns."""
+
+    global _chart
+    with _render_lock:
+        if _chart is None:
+            fig = Figure(dpi=CHART_DPI, figsize=CHART_SIZE)
+            FigureCanvasAgg(fig)
+            _chart = NutritionChart(fig)
+        _chart.update(*plot_vars)
+        buffer = io.BytesIO()
+        _chart.fig.savefig(buffer, format='png',
+                           facecolor=_chart.fig.get_facecolor())
+        return buffer.getvalue()
+
+
+def top_foods(store, n):
+    """The n most complete foods that have not been removed."""
+    candidates = np.flatnonzero(~np.asarray(store.removed))
+    completeness = np.asarray(store.completeness)[candidates]
+    return candidates[np.argsort(-completeness, kind='stable')[:n]]
+
+
+def init_worker(data_path):
+    """Points a worker process at the dataset; the store is memory mapped
+    on first use."""
+    nutrition_plotter.DATA_PATH = data_path
+
+
+def render_foods(food_ids, grams, sex, weight):
+    """Renders and saves the charts of foods not yet on disk, returns how
+    many were rendered."""
+
+    store = get_food_store()
+    cache = ChartCache(chart_dir(store), max_bytes=0)
+    rendered = 0
+    for food_id in food_ids:
+        key = (int(food_id), grams, sex, weight)
+        if os.path.exists(cache.path(key)):
+            continue
+        cache.put(key, render_png(store_plot_vars(store, food_id, grams, sex,
+                                                  weight)))
+        rendered += 1
+    return rendered
+
+
+def prerender(data_path, n, grams, sex, weight, workers=1):
+    """Renders the charts of the n most complete foods, split across a
+    process pool. Returns how many were rendered."""
+
+    init_worker(data_path)
+    food_ids = top_foods(get_food_store(), n)
+    if workers == 1:
+        return render_foods(food_ids, grams, sex, weight)
+    chunks = np.array_split(food_ids, workers * 4)
+    with multiprocessing.Pool(workers, initializer=init_worker,
+                              initargs=(data_path,)) as pool:
+        return sum(pool.starmap(render_foods, [(chunk, grams, sex, weight)
+                                               for chunk in chunks]))
+
+
+def _prerender_quietly(*args):
+    # Yielding the CPU to the application the charts are rendered for.
+    if hasattr(os, 'nice'):
+        os.nice(10)
+    prerender(*args)
+
+
+def prerender_in_background(n, grams, sex, weight):
+    """Starts rendering the top n foods in a separate, low priority process,
+    so it never holds the application's GIL. The process stops with the
+    application."""
+    process = multiprocessing.get_context('spawn').Process(
+        target=_prerender_quietly,
+        args=(nutrition_plotter.DATA_PATH, n, grams, sex, weight),
+        daemon=True)
+    process.start()
+    return process
+
+
+_lock = threading.Lock()
+_chart_cache = None
+
+
+def get_chart_cache():
+    """Opens the chart cache of the application's food store on first use."""
+    global _chart_cache
+    with _lock:
+        if _chart_cache is None:
+            _chart_cache = ChartCache(chart_dir(get_food_store()))
+    return _chart_cache
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Renders the charts of the most complete foods.')
+    parser.add_argument('--data', default=nutrition_plotter.DATA_PATH,
+                        help='nutrition_data.csv whose charts are rendered')
+    parser.add_argument('--top', type=int, default=PRERENDER_FOODS)
+    parser.add_argument('--grams', type=int, default=100)
+    parser.add_argument('--sex', default='Male', choices=['Male', 'Female'])
+    parser.add_argument('--weight', type=int, default=70)
+    parser.add_argument('--workers', type=int,
+                        default=multiprocessing.cpu_count())
+    args = parser.parse_args()
+
+    # Building or checking the store once here, so workers only open it.
+    nutrition_plotter.DATA_PATH = args.data
+    store = get_food_store()
+    start = time.perf_counter()
+    rendered = prerender(args.data, args.top, args.grams, args.sex,
+                         args.weight, args.workers)
+    print('{} charts rendered to {} in {:.1f} s'.format(
+        rendered, chart_dir(store), time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main()
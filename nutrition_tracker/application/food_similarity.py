@@ -0,0 +1,134 @@
+import threading
+import numpy as np
+from nutrition_plotter import get_food_store
+
+
+def known_bit_masks(known):
+    """Packs each row of a (foods, up to 64) boolean array into a uint64."""
+    packed = np.packbits(known, axis=1, bitorder='little')
+    padded = np.zeros((len(known), 8), dtype=np.uint8)
+    padded[:, :packed.shape[1]] = packed
+    return padded.view('<u8').ravel()
+
+
+class FoodSimilarity:
+    """Nearest-neighbour queries over the per 100g nutrient vectors.
+
+    Two matrices are computed once: the amounts with missing values as zero,
+    stored a nutrient per column to score portions, and a profile vector per
+    food, used for similarity. Profiles are the log amounts standardised per
+    nutrient, with missing values at the nutrient's mean, scaled to unit
+    length, so the similarity of one food to every other is a single
+    matrix-vector product.
+    Which nutrients each food has data for is kept as a 48 bit mask."""
+
+    def __init__(self, nutrients, completeness=None, removed=None,
+                 min_completeness=0):
+        values = np.asarray(nutrients, dtype=np.float32)
+        known = ~np.isnan(values)
+        self.amounts = np.asfortranarray(np.nan_to_num(values))
+        self.known_bits = known_bit_masks(known)
+        self.known_counts = known.sum(axis=1)
+
+        # Standardising each nutrient's log amounts over the foods with data.
+        logged = np.log1p(np.maximum(self.amounts, 0))
+        counts = np.maximum(known.sum(axis=0), 1)
+        mean = logged.sum(axis=0, where=known) / counts
+        spread = np.sqrt(((logged - mean) ** 2).sum(axis=0, where=known)
+                         / counts)
+        spread[spread == 0] = 1
+        vectors = (logged - mean) / spread
+        vectors[~known] = 0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        self.vectors = np.ascontiguousarray(vectors / norms,
+                                            dtype=np.float32)
+
+        # Foods that may be returned: not removed and complete enough.
+        self.candidates = np.ones(len(values), dtype=bool)
+        if removed is not None:
+            self.candidates &= ~np.asarray(removed)
+        if completeness is not None:
+            self.candidates &= (np.asarray(completeness, dtype=float)
+                                >= min_completeness)
+
+    def similar_foods(self, food_id, n=20):
+        """Returns the ids and scores of the n foods whose nutrient profiles
+        are most like food_id's. Cosine similarity is weighted by the share
+        of the food's known nutrients the other food also has data for."""
+
+        similarity = self.vectors @ self.vectors[food_id]
+        shared = np.bitwise_count(self.known_bits
+                                  & self.known_bits[food_id])
+        similarity *= shared / max(int(self.known_counts[food_id]), 1)
+        similarity[~self.candidates] = -np.inf
+        similarity[food_id] = -np.inf
+        return top_scores(similarity, n)
+
+    def gap_filling_foods(self, totals, rdi_profile, grams=100, n=20,
+                          limit_weight=1.):
+        """Returns the ids and scores of the n foods that, in the given
+        amount, best fill the gaps between a day's nutrient totals and the
+        profile's green targets, less a penalty for the share of each red
+        limit they use, doubled for any amount beyond what is left of it.
+
+        Scores are summed a nutrient at a time over contiguous columns, only
+        for nutrients with a gap or a limit, in float32."""
+
+        totals = np.nan_to_num(np.asarray(totals, dtype=float))
+        targets = rdi_profile.targets
+        remaining = targets - totals
+        gaps = np.flatnonzero(rdi_profile.reach & (remaining > 0))
+        limits = np.flatnonzero(rdi_profile.limit)
+        gap_weight = 1 / max(int(rdi_profile.reach.sum()), 1)
+        limit_share = limit_weight / max(len(limits), 1)
+        scale = grams / 100
+
+        # Working in per 100g amounts, so the matrix is never rescaled.
+        scores = np.zeros(len(self.amounts), dtype=np.float32)
+        column = np.empty(len(self.amounts), dtype=np.float32)
+        for nutrient in gaps:
+            np.minimum(self.amounts[:, nutrient], remaining[nutrient] / scale,
+                       out=column)
+            column *= gap_weight * scale / targets[nutrient]
+            scores += column
+        for nutrient in limits:
+            amounts = self.amounts[:, nutrient]
+            np.subtract(amounts, max(remaining[nutrient], 0) / scale,
+                        out=column)
+            np.maximum(column, 0, out=column)
+            column += amounts
+            column *= limit_share * scale / targets[nutrient]
+            scores -= column
+
+        scores[~self.candidates] = -np.inf
+        return top_scores(scores, n)
+
+
+def top_scores(scores, n):
+    """Returns the positions of the n highest finite scores, highest first,
+    and the scores."""
+
+    n = min(n, int(np.isfinite(scores).sum()))
+    if n == 0:
+        return np.empty(0, dtype=np.int64), scores[:0]
+    best = np.argpartition(-scores, n - 1)[:n]
+    best = best[np.argsort(-scores[best], kind='stable')]
+    return best, scores[best]
+
+
+_lock = threading.Lock()
+_food_similarity = None
+
+
+def get_food_similarity():
+    """Builds the similarity matrices for the application's food store on
+    first use."""
+    global _food_similarity
+    with _lock:
+        if _food_similarity is None:
+            store = get_food_store()
+            _food_similarity = FoodSimilarity(store.nutrients,
+                                              store.completeness,
+                                              store.removed)
+    return _food_similarity
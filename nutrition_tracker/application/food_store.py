@@ -0,0 +1,289 @@
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+
+STORE_VERSION = 3
+NUTRIENT_COLUMNS = slice(1, -2)
+META_KEYS = {'rows', 'nutrient_names', 'source_size', 'source_mtime_ns',
+             'source_sha1'}
+
+
+def file_digest(path, block_size=1 << 20):
+    """Returns the SHA-1 hex digest of a file, read in blocks."""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def default_store_dir(csv_path):
+    """The binary store sits next to the CSV it was built from."""
+    return os.path.splitext(csv_path)[0] + '_store'
+
+
+class FoodStore:
+    """A compact, memory-mapped copy of nutrition_data.csv.
+
+    Nutrient values are held as a float32 matrix with one row per food and one
+    column per nutrient, descriptions as a single packed UTF-8 byte table with
+    row offsets, and completeness as a float64 array. Arrays are mapped from
+    disk rather than read, so opening a store costs almost nothing.
+
+    Rows are the food ids used by the application. Foods removed by a
+    release update keep their row, flagged in 'removed', so saved diary
+    entries still refer to the same food."""
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, 'meta.json')) as file:
+            self.meta = json.load(file)
+        self.nutrient_names = self.meta['nutrient_names']
+        self.fdc_ids = self._load('fdc_id')
+        self.nutrients = self._load('nutrients')
+        self.completeness = self._load('completeness')
+        self.description_offsets = self._load('description_offsets')
+        self.description_bytes = self._load('descriptions')
+        self.removed = self._load('removed')
+        self._descriptions = None
+
+    def _load(self, name):
+        return np.load(os.path.join(self.store_dir, name + '.npy'),
+                       mmap_mode='r')
+
+    def __len__(self):
+        return len(self.fdc_ids)
+
+    def description(self, row):
+        """Decodes a single food description from the packed string table."""
+        start, stop = self.description_offsets[row:row + 2]
+        return self.description_bytes[start:stop].tobytes().decode('utf-8')
+
+    @property
+    def descriptions(self):
+        """All food descriptions, decoded once and then reused."""
+        if self._descriptions is None:
+            packed = self.description_bytes.tobytes()
+            offsets = self.description_offsets.tolist()
+            self._descriptions = [
+                packed[start:stop].decode('utf-8')
+                for start, stop in zip(offsets[:-1], offsets[1:])]
+        return self._descriptions
+
+    def to_dataframe(self):
+        """Rebuilds the DataFrame layout produced by reading the CSV:
+        fdc_id, the nutrient columns, Description and Completeness (%)."""
+        df = pd.DataFrame(self.nutrients, columns=self.nutrient_names)
+        df.insert(0, 'fdc_id', self.fdc_ids)
+        df['Description'] = self.descriptions
+        df['Completeness (%)'] = self.completeness
+        return df
+
+
+def build_food_store(csv_path, store_dir=None):
+    """Converts the CSV to the binary store format. Files are written under
+    temporary names and meta.json last, so an interrupted build is detected
+    as stale on the next load."""
+
+    store_dir = store_dir or default_store_dir(csv_path)
+    os.makedirs(store_dir, exist_ok=True)
+    source_stat = os.stat(csv_path)
+
+    header = pd.read_csv(csv_path, index_col=0, nrows=0)
+    nutrient_names = list(header.columns[NUTRIENT_COLUMNS])
+    df = pd.read_csv(csv_path, index_col=0,
+                     dtype={name: np.float32 for name in nutrient_names})
+
+    write_arrays(store_dir, {
+        'fdc_id': df['fdc_id'].to_numpy(dtype=np.int64),
+        'nutrients': np.ascontiguousarray(
+            df[nutrient_names].to_numpy(dtype=np.float32)),
+        'completeness': df['Completeness (%)'].to_numpy(dtype=np.float64),
+        'removed': np.zeros(len(df), dtype=bool)})
+    write_descriptions(store_dir, df['Description'].fillna(''))
+
+    meta = {'version': STORE_VERSION,
+            'rows': len(df),
+            'nutrient_names': nutrient_names,
+            'source_size': source_stat.st_size,
+            'source_mtime_ns': source_stat.st_mtime_ns,
+            'source_sha1': file_digest(csv_path),
+            'deltas': []}
+    write_meta(store_dir, meta)
+    return FoodStore(store_dir)
+
+
+def write_arrays(store_dir, arrays):
+    """Saves each array under a temporary name, then moves it into place.
+    Processes with the old file mapped keep reading the old copy."""
+    for name, array in arrays.items():
+        temp_path = os.path.join(store_dir, name + '.tmp.npy')
+        np.save(temp_path, array)
+        os.replace(temp_path, os.path.join(store_dir, name + '.npy'))
+
+
+def write_descriptions(store_dir, descriptions):
+    """Packs descriptions into one UTF-8 byte table with row offsets."""
+    encoded = [str(description).encode('utf-8')
+               for description in descriptions]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(description) for description in encoded])
+    write_arrays(store_dir, {
+        'description_offsets': offsets,
+        'descriptions': np.frombuffer(b''.join(encoded), dtype=np.uint8)})
+
+
+def write_meta(store_dir, meta):
+    """Atomically replaces a store's meta.json."""
+    temp_path = os.path.join(store_dir, 'meta.json.tmp')
+    with open(temp_path, 'w') as file:
+        json.dump(meta, file, indent=1)
+    os.replace(temp_path, os.path.join(store_dir, 'meta.json'))
+
+
+def store_is_current(csv_path, store_dir):
+    """Checks whether a store was built from the current CSV. A matching size
+    and mtime is trusted; otherwise the file is hashed, so touching the CSV
+    without changing it does not force a rebuild. A store without a
+    complete meta.json, as left by an interrupted build or delta, is never
+    current."""
+
+    try:
+        with open(os.path.join(store_dir, 'meta.json')) as file:
+            meta = json.load(file)
+    except (OSError, ValueError):
+        return False
+    if (meta.get('version') != STORE_VERSION
+            or not META_KEYS.issubset(meta)):
+        return False
+
+    source_stat = os.stat(csv_path)
+    if (meta['source_size'] == source_stat.st_size
+            and meta['source_mtime_ns'] == source_stat.st_mtime_ns):
+        return True
+    if file_digest(csv_path) != meta['source_sha1']:
+        return False
+
+    meta['source_size'] = source_stat.st_size
+    meta['source_mtime_ns'] = source_stat.st_mtime_ns
+    write_meta(store_dir, meta)
+    return True
+
+
+def load_food_store(csv_path, store_dir=None):
+    """Opens the binary store for a CSV, rebuilding it first if the CSV has
+    changed since it was built. When the CSV is missing an existing store is
+    used as-is. A store left mid-swap by apply_delta is recovered first."""
+
+    store_dir = store_dir or default_store_dir(csv_path)
+    recover_store(store_dir)
+    if os.path.exists(csv_path) and not store_is_current(csv_path, store_dir):
+        return build_food_store(csv_path, store_dir)
+    return FoodStore(store_dir)
+
+
+def apply_delta(store_dir, delta_path):
+    """Patches a store with a release delta written by
+    data_wrangling/delta.py, rather than rebuilding it. Foods are matched by
+    fdc_id: changed foods are overwritten in their existing row, added foods
+    are appended and removed foods are flagged, so no existing row moves.
+    Returns the counts of changed, added and removed foods.
+
+    The patched store is still matched to the CSV it was first built from,
+    so it is only rebuilt, renumbering foods, if that CSV is replaced.
+    The patched store is written to a sibling directory and swapped in
+    whole, so an interruption leaves either the old store or the patched
+    one, never a rebuild that would renumber the added foods."""
+
+    # Clearing what an earlier interrupted delta left beside the store.
+    recover_store(store_dir)
+    for leftover in (store_dir + '.new', store_dir + '.old'):
+        shutil.rmtree(leftover, ignore_errors=True)
+    store = FoodStore(store_dir)
+    delta = np.load(delta_path)
+    if list(delta['nutrient_names']) != store.nutrient_names:
+        raise ValueError('Delta nutrients do not match the store')
+
+    fdc_ids = np.array(store.fdc_ids)
+    nutrients = np.array(store.nutrients)
+    completeness = np.array(store.completeness)
+    removed = np.array(store.removed)
+    descriptions = list(store.descriptions)
+
+    # Finding each delta food's row by binary search over the sorted ids.
+    order = np.argsort(fdc_ids, kind='stable')
+    sorted_ids = fdc_ids[order]
+
+    def rows_of(ids):
+        positions = np.minimum(np.searchsorted(sorted_ids, ids),
+                               max(len(sorted_ids) - 1, 0))
+        found = (sorted_ids[positions] == ids if len(sorted_ids)
+                 else np.zeros(len(ids), dtype=bool))
+        return np.where(found, order[positions], -1)
+
+    removed_rows = rows_of(delta['removed'])
+    removed[removed_rows[removed_rows >= 0]] = True
+
+    # Overwriting foods already in the store, including revived ones.
+    rows = rows_of(delta['fdc_id'])
+    existing = rows >= 0
+    nutrients[rows[existing]] = delta['nutrients'][existing]
+    completeness[rows[existing]] = delta['completeness'][existing]
+    removed[rows[existing]] = False
+    for row, description in zip(rows[existing],
+                                delta['descriptions'][existing]):
+        descriptions[row] = str(description)
+
+    # Appending new foods after every existing row.
+    added = ~existing
+    fdc_ids = np.concatenate([fdc_ids, delta['fdc_id'][added]])
+    nutrients = np.concatenate([nutrients, delta['nutrients'][added]])
+    completeness = np.concatenate([completeness,
+                                   delta['completeness'][added]])
+    removed = np.concatenate([removed, np.zeros(added.sum(), dtype=bool)])
+    descriptions.extend(str(description)
+                        for description in delta['descriptions'][added])
+
+    new_dir = store_dir + '.new'
+    os.makedirs(new_dir)
+    write_arrays(new_dir, {'fdc_id': fdc_ids,
+                           'nutrients': nutrients.astype(np.float32),
+                           'completeness': completeness,
+                           'removed': removed})
+    write_descriptions(new_dir, descriptions)
+
+    counts = {'changed': int(existing.sum()), 'added': int(added.sum()),
+              'removed': int((removed_rows >= 0).sum())}
+    meta = dict(store.meta, rows=len(fdc_ids))
+    meta['deltas'] = meta.get('deltas', []) + [
+        dict(counts, release=str(delta['release']))]
+    write_meta(new_dir, meta)
+    swap_store(store_dir, new_dir)
+    return counts
+
+
+def swap_store(store_dir, new_dir):
+    """Moves the complete store in new_dir into store_dir's place. A
+    directory is only replaced once empty, so the old store is moved aside
+    first and deleted last; recover_store finishes a swap cut short."""
+    old_dir = store_dir + '.old'
+    os.replace(store_dir, old_dir)
+    os.replace(new_dir, store_dir)
+    shutil.rmtree(old_dir)
+
+
+def recover_store(store_dir):
+    """Finishes a delta interrupted while swapping stores. Without a store,
+    a patched store with its meta.json is moved into place, otherwise the
+    old one is moved back."""
+
+    new_dir, old_dir = store_dir + '.new', store_dir + '.old'
+    if os.path.exists(store_dir):
+        return
+    if os.path.exists(os.path.join(new_dir, 'meta.json')):
+        os.replace(new_dir, store_dir)
+    elif os.path.exists(old_dir):
+        os.replace(old_dir, store_dir)
@@ -0,0 +1,63 @@
+import numpy as np
+from PyQt5.QtCore import QAbstractTableModel, QModelIndex, Qt
+
+
+class FoodTableModel(QAbstractTableModel):
+    """A two column table of search results (description and completeness)
+    backed directly by an array of food ids.
+
+    Cells are only formatted when the view asks for them, and large result
+    sets are exposed to the view in batches through canFetchMore/fetchMore as
+    the user scrolls, so a broad search never creates a widget per row."""
+
+    def __init__(self, food_store, batch_size=1000, parent=None):
+        super().__init__(parent)
+        self.food_store = food_store
+        self.batch_size = batch_size
+        self.food_ids = np.empty(0, dtype=np.int64)
+        self.loaded_rows = 0
+
+    def set_food_ids(self, food_ids):
+        """Replaces the results shown, starting again from the first batch."""
+        self.beginResetModel()
+        self.food_ids = np.asarray(food_ids, dtype=np.int64)
+        self.loaded_rows = min(len(self.food_ids), self.batch_size)
+        self.endResetModel()
+
+    def food_id(self, row):
+        """Returns the food id displayed on a table row."""
+        return int(self.food_ids[row])
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return self.loaded_rows
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return 2
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or not index.isValid():
+            return None
+        food_id = self.food_ids[index.row()]
+        if index.column() == 0:
+            return self.food_store.description(food_id)
+        return str(self.food_store.completeness[food_id]) + '%'
+
+    def canFetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return False
+        return self.loaded_rows < len(self.food_ids)
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return
+        new_rows = min(self.batch_size, len(self.food_ids) - self.loaded_rows)
+        if new_rows <= 0:
+            return
+        self.beginInsertRows(QModelIndex(), self.loaded_rows,
+                             self.loaded_rows + new_rows - 1)
+        self.loaded_rows += new_rows
+        self.endInsertRows()
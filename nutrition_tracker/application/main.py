@@ -1,14 +1,64 @@
 import sys
-import matplotlib.pyplot as plt
-from PyQt5.QtWidgets import QApplication, QMainWindow, QTableWidgetItem
+from PyQt5.QtCore import QTimer
+from PyQt5.QtGui import QImage, QPixmap
+from PyQt5.QtWidgets import QApplication, QLabel, QMainWindow
 from UiMainWindow import Ui_MainWindow
-from nutrition_plotter import Canvas, NutritionDiary, regex_search, df, rdi_df
+from nutrition_plotter import (Canvas, create_plot_vars, search_food_ids,
+                               get_df, get_rdi_df, get_food_store,
+                               get_rdi_profile, get_search_index)
+from chart_cache import (PRERENDER_FOODS, get_chart_cache,
+                         prerender_in_background, render_png)
+from food_similarity import get_food_similarity
+from food_table_model import FoodTableModel
+from nutrition_diary import NutritionDiary
+from workers import BackgroundWorker
+import profiling
+
+DIARY_PATH = 'nutrition_diary.bin'
+
+# Live searches wait for a pause in typing of this many milliseconds.
+SEARCH_DEBOUNCE_MS = 120
+
+# Work run on the background worker's threads.
+def find_foods(text_string):
+    return search_food_ids(text_string, get_df())
+
+def prepare_search():
+    get_search_index(get_df()).warm_prefixes()
+
+def similar_food_ids(food_id):
+    return get_food_similarity().similar_foods(food_id)[0]
+
+def gap_filling_food_ids(totals, grams, sex, weight):
+    return get_food_similarity().gap_filling_foods(
+        totals, get_rdi_profile(sex, weight), grams)[0]
+
+def food_plot_vars(food_id, grams, sex, weight):
+    return create_plot_vars(get_df(), food_id, grams, get_rdi_df(), True,
+                            sex, weight)
+
+def food_chart(food_id, grams, sex, weight):
+    # A chart shown before is decoded from the cache, otherwise the plot
+    # data is computed for the Canvas.
+    png = get_chart_cache().get((food_id, grams, sex, weight))
+    if png is not None:
+        return QImage.fromData(png, 'PNG')
+    return food_plot_vars(food_id, grams, sex, weight)
+
+def store_chart(key, plot_vars):
+    # Rendered again off screen rather than copied from the Canvas, so every
+    # cached chart has the same size whatever the screen's scaling.
+    get_chart_cache().put(key, render_png(plot_vars))
+
+def diary_plot_vars(diary, sex, weight):
+    return create_plot_vars(diary, None, None, get_rdi_df(), True, sex,
+                            weight)
 
 class MainWindow:
     def __init__(self):
         self.main_win = QMainWindow()
         self.ui = Ui_MainWindow()
-        self.diary_instance = NutritionDiary()
+        self.diary_instance = NutritionDiary(DIARY_PATH)
         
         self.grams = 100
         self.sex = 'Male'
@@ -20,11 +70,34 @@ class MainWindow:
         self.ui.back_btn.clicked.connect(self.back_btn_clicked)
         self.ui.search_btn.clicked.connect(self.search_btn_clicked)
         self.ui.diary_btn.clicked.connect(self.diary_btn_clicked)        
+        self.ui.suggest_btn.clicked.connect(self.suggest_btn_clicked)
+        self.ui.similar_btn.clicked.connect(self.similar_btn_clicked)
         self.ui.plus_btn.clicked.connect(self.add_btn_clicked)
         
         self.ui.m_btn.clicked.connect(self.m_btn_clicked)
         self.ui.f_btn.clicked.connect(self.f_btn_clicked)
         self.ui.search_field.returnPressed.connect(self.search_returned)
+        self.ui.table_search_field.returnPressed.connect(self.search_returned)
+        self.ui.search_field.textEdited.connect(self.search_edited)
+        self.ui.table_search_field.textEdited.connect(self.search_edited)
+        
+        self.search_timer = QTimer()
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(SEARCH_DEBOUNCE_MS)
+        self.search_timer.timeout.connect(self.live_search)
+        
+        self.table_model = FoodTableModel(get_food_store())
+        self.ui.set_table_model(self.table_model)
+        self.ui.table.selectionModel().selectionChanged.connect(
+            self.on_selectionChanged)
+        
+        self.worker = BackgroundWorker()
+        self.worker.result_ready.connect(self.on_result_ready)
+        self.worker.error.connect(self.on_task_error)
+        self.worker.submit('prepare', prepare_search)
+        self.worker.submit('prepare_similarity', get_food_similarity)
+        self.prerender = prerender_in_background(PRERENDER_FOODS, self.grams,
+                                                 self.sex, self.weight)
         
         self.ui.hide_righthand_widgets()
     
@@ -38,12 +111,12 @@ class MainWindow:
             self.show_table()
             
     def search_btn_clicked(self):
-        plt.close()
+        self.search_timer.stop()
+        self.ui.table_search_field.clear()
         self.ui.stackedWidget.setCurrentWidget(self.ui.search_pg)
         self.ui.hide_righthand_widgets()
     
     def diary_btn_clicked(self):
-        plt.close()
         self.plot_diary_chart()
         self.ui.stackedWidget.setCurrentWidget(self.ui.diary_pg)
         self.ui.hide_righthand_widgets()
@@ -51,10 +124,23 @@ class MainWindow:
     def add_btn_clicked(self):
         try:
             self.change_default_values()
-            self.diary_instance.add_food(df, self.food_id, self.grams)
+            self.diary_instance.add_food(self.food_id, self.grams)
         except AttributeError:
             print('User didn\'t select a food')
         
+    def similar_btn_clicked(self):
+        # Similar foods and suggestions replace the search results.
+        try:
+            self.worker.submit('search', similar_food_ids, self.food_id)
+        except AttributeError:
+            print('User didn\'t select a food')
+    
+    def suggest_btn_clicked(self):
+        self.change_default_values()
+        self.worker.submit('search', gap_filling_food_ids,
+                           self.diary_instance.diary.to_numpy(), self.grams,
+                           self.sex, self.weight)
+    
     def m_btn_clicked(self):
         self.ui.m_btn.setStyleSheet('font: bold 12px')
         self.ui.f_btn.setStyleSheet('font: normal 12px')
@@ -66,48 +152,45 @@ class MainWindow:
         self.sex = 'Female'
         
     def search_returned(self):
-        text_string = self.ui.search_field.text()
-        self.create_table(text_string)
-        self.show_table()
-        self.ui.search_field.clear()
+        self.search_timer.stop()
+        self.live_search()
+    
+    def search_edited(self, text_string):
+        # Typing on the search page carries on in the results page's field,
+        # where results update as the user types.
+        if self.ui.stackedWidget.currentWidget() == self.ui.search_pg:
+            self.ui.search_field.clear()
+            self.ui.table_search_field.setText(text_string)
+            self.show_table()
+            self.ui.table_search_field.setFocus()
+        self.search_timer.start()
+    
+    def live_search(self):
+        text_string = self.ui.table_search_field.text()
+        if text_string.strip() != '':
+            self.worker.submit('search', find_foods, text_string)
                
-    def create_table(self, text_string):
-        self.table_df = regex_search(text_string, df)
-        self.ui.make_table()
-        self.ui.table.setRowCount(len(self.table_df))
-        self.ui.table.setRowHeight(10, 10)
-        
-        row = 0
-        for index, df_row in self.table_df.iterrows():
-            self.ui.table.setItem(row,
-                                  0,
-                                  QTableWidgetItem(df_row.Description))
-            self.ui.table.setItem(row,
-                                  1,
-                                  QTableWidgetItem(
-                                      str(df_row['Completeness (%)']) + '%'))
-            self.ui.table.setRowHeight(row, 25)
-            row += 1
-        self.ui.table.selectionModel().selectionChanged.connect(self.on_selectionChanged)
+    def create_table(self, food_ids):
+        with profiling.stage('table build'):
+            self.table_model.set_food_ids(food_ids)
     
     def show_table(self):        
         self.ui.stackedWidget.setCurrentWidget(self.ui.table_pg)
         self.ui.show_righthand_widgets()
-        plt.close()
         
     def on_selectionChanged(self, selected, deselected):
+        if not selected.indexes():
+            return
         self.food_id = 0
         for x in selected.indexes():
-            self.food_id = self.table_df.index[x.row()]
+            self.food_id = self.table_model.food_id(x.row())
         self.create_vis(self.food_id, self.grams, self.sex, self.weight)
         self.ui.stackedWidget.setCurrentWidget(self.ui.vis_pg)
                
     def create_vis(self, food_id, grams, sex, weight):
-        plt.close()
         self.change_default_values()
-        self.ui.vis_pg.chart = Canvas(self.ui.vis_pg, df, food_id, self.grams,
-                                      rdi_df, True, self.sex, self.weight)  
-        self.ui.vis_pg.chart.move(0,-13)
+        self.plot_key = (food_id, self.grams, self.sex, self.weight)
+        self.worker.submit('plot', food_chart, *self.plot_key)
            
     def change_default_values(self):
         try:
@@ -119,18 +202,79 @@ class MainWindow:
             print('User entered non-int weight or grams')
       
     def plot_diary_chart(self):
-        self.ui.diary_pg.chart = Canvas(self.ui.diary_pg,
-                                        self.diary_instance.diary,
-                                        None, None, rdi_df, True,
-                                        self.sex, self.weight)
-        self.ui.diary_pg.chart.move(0,-13)
+        self.worker.submit('diary', diary_plot_vars, self.diary_instance.diary,
+                           self.sex, self.weight)
+    
+    def page_chart(self, page):
+        # Each page's chart is built once and updated on later views.
+        if getattr(page, 'chart', None) is None:
+            page.chart = Canvas(page)
+            page.chart.move(0,-13)
+            page.chart.pending_paint = None
+            page.chart.mpl_connect(
+                'draw_event', lambda event, chart=page.chart:
+                    self.chart_drawn(chart))
+        return page.chart
+    
+    def show_chart_image(self, page, image):
+        # Cached charts are shown as an image in place of the page's chart.
+        if getattr(page, 'image', None) is None:
+            page.image = QLabel(page)
+            page.image.move(0,-13)
+        if getattr(page, 'chart', None) is not None:
+            page.chart.hide()
+        page.image.setPixmap(QPixmap.fromImage(image))
+        page.image.adjustSize()
+        page.image.show()
+    
+    def on_result_ready(self, kind, request_id, result):
+        if kind == 'search':
+            self.create_table(result)
+            self.show_table()
+            self.worker.record_paint(kind, request_id)
+            return
+        elif kind == 'plot':
+            page = self.ui.vis_pg
+            if isinstance(result, QImage):
+                self.show_chart_image(page, result)
+                self.worker.record_paint(kind, request_id)
+                return
+        elif kind == 'diary':
+            page = self.ui.diary_pg
+        else:
+            return
+        if getattr(page, 'image', None) is not None:
+            page.image.hide()
+        chart = self.page_chart(page)
+        chart.show()
+        chart.show_plot_vars(result)
+        chart.pending_paint = (kind, request_id)
+        # The food chart is saved by the worker, so the next view of the
+        # food skips Matplotlib. Every chart shown is saved, however quickly
+        # the next one follows.
+        if kind == 'plot':
+            self.worker.submit_always('store_chart', store_chart,
+                                      self.plot_key, result)
+    
+    def chart_drawn(self, chart):
+        # Paint latency runs until the chart has actually been redrawn.
+        if chart.pending_paint is not None:
+            self.worker.record_paint(*chart.pending_paint)
+            chart.pending_paint = None
+    
+    def on_task_error(self, kind, request_id, error):
+        print('Background {} task failed: {!r}'.format(kind, error))
         
 def main():
+    # --profile records stage latencies and prints them on exit, as does
+    # setting NUTRITION_PROFILE.
+    if '--profile' in sys.argv:
+        profiling.enable()
     app = QApplication(sys.argv)
     window = MainWindow()
     window.show()
     close_app = app.exec_()
-    plt.close()
+    window.worker.wait()
     sys.exit(close_app)    
     
 if __name__ == '__main__':
@@ -0,0 +1,318 @@
+"""Daily meal plans that meet a person's RDI targets.
+
+    python meal_planner.py --sex Female --weight 60
+    python meal_planner.py --profiles profiles.csv --output plans.csv
+
+A plan is a handful of foods and gram amounts that reach the green (reach)
+targets, keep the red (limit) nutrients under their targets and keep energy
+within a band around the energy target. It is found by a mixed integer
+linear program over a few hundred candidate foods:
+
+- foods below a completeness threshold, or removed, are skipped, as their
+  missing values would count as zero;
+- the remaining foods are ranked per green nutrient by how much of it they
+  give per calorie and per 100g, and the best few of each are kept;
+- candidates that another candidate of about the same energy beats on every
+  green nutrient without more of any red one, per 100g, are dropped.
+
+Every target may be missed at a cost, exceeding a limit or the energy band
+costing ten times more than falling short of a green target, so a plan is
+always returned and reports what it misses. The solver stops at the time
+budget with the best plan found so far. --profiles plans for many
+(sex, weight) rows of a CSV across a process pool.
+"""
+import argparse
+import multiprocessing
+import time
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.optimize import Bounds, LinearConstraint, milp
+import nutrition_plotter
+from nutrition_plotter import get_food_store, get_rdi_profile
+
+ENERGY_ROW = 0
+
+# Objective weights per 100% of a target: exceeding a red limit or leaving
+# the energy band, then falling short of a green target, then the number of
+# foods, then the total weight eaten.
+EXCESS_COST = 1000.
+SHORTFALL_COST = 100.
+FOOD_COST = 0.1
+GRAMS_COST = 0.001
+
+
+class MealPlan:
+    """Foods and gram amounts chosen for one profile, with the resulting
+    nutrient totals and the solver's status message."""
+
+    def __init__(self, food_ids, grams, totals, rdi_profile, status,
+                 seconds, candidates):
+        self.food_ids = np.asarray(food_ids, dtype=np.int64)
+        self.grams = np.asarray(grams, dtype=float)
+        self.totals = totals
+        self.rdi_profile = rdi_profile
+        self.status = status
+        self.seconds = seconds
+        self.candidates = candidates
+
+    def __len__(self):
+        return len(self.food_ids)
+
+    def coverage(self):
+        """The plan's totals as a percentage of each RDI target."""
+        return self.rdi_profile.percentages(self.totals)[0]
+
+    def shortfalls(self):
+        """Names of the green targets the plan does not reach."""
+        percent = self.coverage()
+        return [name for name, reach, value in
+                zip(self.rdi_profile.nutrient_names, self.rdi_profile.reach,
+                    percent) if reach and value < 99.9]
+
+    def excesses(self):
+        """Names of the red limits the plan goes over."""
+        percent = self.coverage()
+        return [name for name, limit, value in
+                zip(self.rdi_profile.nutrient_names, self.rdi_profile.limit,
+                    percent) if limit and value > 100.1]
+
+    def to_dataframe(self, store=None):
+        """One row per food: food_id, fdc_id, Description and grams."""
+        store = store or get_food_store()
+        return pd.DataFrame({
+            'food_id': self.food_ids,
+            'fdc_id': np.asarray(store.fdc_ids)[self.food_ids],
+            'Description': [store.description(food_id)
+                            for food_id in self.food_ids],
+            'grams': np.round(self.grams, 1)})
+
+    def add_to_diary(self, diary, timestamp=None):
+        """Adds every food of the plan to a NutritionDiary, returns the new
+        entry indices."""
+        return [diary.add_food(int(food_id), float(grams), timestamp)
+                for food_id, grams in zip(self.food_ids, self.grams)]
+
+
+def candidate_foods(nutrients, completeness, removed, rdi_profile,
+                    min_completeness=75, per_nutrient=30):
+    """Returns the ids of the foods offered to the solver, see the module
+    docstring."""
+
+    live = np.flatnonzero(~np.asarray(removed)
+                          & (np.asarray(completeness) >= min_completeness))
+    if len(live) == 0:
+        return live
+    amounts = np.nan_to_num(np.asarray(nutrients[live], dtype=float))
+
+    # The best sources of each green nutrient, per calorie and per 100g.
+    # Energy is floored so foods with almost no calories are not ranked
+    # infinitely dense.
+    energy = np.maximum(amounts[:, ENERGY_ROW], 10.)
+    reach = np.flatnonzero(rdi_profile.reach)
+    keep = min(per_nutrient, len(live))
+    chosen = np.unique(np.concatenate([
+        np.argpartition(-density, keep - 1, axis=0)[:keep].ravel()
+        for density in (amounts[:, reach] / energy[:, np.newaxis],
+                        amounts[:, reach])]))
+    chosen = chosen[amounts[chosen][:, reach].sum(axis=1) > 0]
+    return live[chosen[~dominated(amounts[chosen], rdi_profile)]]
+
+
+def dominated(amounts, rdi_profile, block=128, energy_tolerance=0.1):
+    """Flags foods for which another food with about the same energy has at
+    least as much of every green nutrient and at most as much of every red
+    one, per 100g. Energy must be within energy_tolerance of the food's, as
+    the energy band also sets a floor. Of identical foods the first is
+    kept."""
+
+    reach = amounts[:, rdi_profile.reach]
+    limit = amounts[:, rdi_profile.limit
+                    & (np.arange(amounts.shape[1]) != ENERGY_ROW)]
+    energy = amounts[:, ENERGY_ROW]
+    flags = np.zeros(len(amounts), dtype=bool)
+    order = np.arange(len(amounts))
+    for start in range(0, len(amounts), block):
+        # Comparing a block of foods against all of them at once.
+        stop = start + block
+        at_least = ((reach[:, np.newaxis] >= reach[start:stop]).all(axis=2)
+                    & (limit[:, np.newaxis] <= limit[start:stop]).all(axis=2)
+                    & (np.abs(energy[:, np.newaxis] - energy[start:stop])
+                       <= energy_tolerance * energy[start:stop]))
+        strictly = ((reach[:, np.newaxis] > reach[start:stop]).any(axis=2)
+                    | (limit[:, np.newaxis] < limit[start:stop]).any(axis=2))
+        earlier = order[:, np.newaxis] < order[start:stop]
+        flags[start:stop] = (at_least & (strictly | earlier)).any(axis=0)
+    return flags
+
+
+def plan_meals(rdi_profile, nutrients=None, completeness=None, removed=None,
+               energy_band=(0.9, 1.0), max_foods=8, min_grams=20,
+               max_grams=400, time_budget=5., min_completeness=75,
+               per_nutrient=30):
+    """Finds a day's plan for an RdiProfile, see the module docstring.
+    energy_band is the allowed energy as fractions of the energy target,
+    portions are between min_grams and max_grams."""
+
+    start = time.perf_counter()
+    # Any of the food arrays not given are the application's store's.
+    if nutrients is None or completeness is None or removed is None:
+        store = get_food_store()
+        if nutrients is None:
+            nutrients = store.nutrients
+        if completeness is None:
+            completeness = store.completeness
+        if removed is None:
+            removed = store.removed
+    candidates = candidate_foods(nutrients, completeness, removed,
+                                 rdi_profile, min_completeness, per_nutrient)
+    targets = rdi_profile.targets
+    amounts = np.nan_to_num(np.asarray(nutrients[candidates], dtype=float))
+    n_foods = len(candidates)
+    reach = np.flatnonzero(rdi_profile.reach)
+    limit = np.flatnonzero(rdi_profile.limit
+                           & (np.arange(len(targets)) != ENERGY_ROW))
+    energy_low = targets[ENERGY_ROW] * energy_band[0]
+    energy_high = targets[ENERGY_ROW] * energy_band[1]
+
+    # Variables, in order: each food's amount in units of 100g, whether each
+    # food is used, each green target's shortfall, each red limit's excess
+    # and the energy below and above the band.
+    n_reach, n_limit = len(reach), len(limit)
+    variables = [('amount', n_foods), ('used', n_foods),
+                 ('shortfall', n_reach), ('excess', n_limit), ('under', 1),
+                 ('over', 1)]
+
+    def rows(count, **blocks):
+        # Lays out rows over every variable, zero where no block is given.
+        return sparse.hstack([
+            sparse.csr_matrix(blocks[name]) if name in blocks
+            else sparse.csr_matrix((count, size))
+            for name, size in variables])
+
+    portions = sparse.csr_matrix(amounts.T)
+    foods = sparse.identity(n_foods)
+    constraints = [
+        LinearConstraint(rows(n_reach, amount=portions[reach],
+                              shortfall=sparse.identity(n_reach)),
+                         targets[reach], np.inf),
+        LinearConstraint(rows(n_limit, amount=portions[limit],
+                              excess=-sparse.identity(n_limit)),
+                         -np.inf, targets[limit]),
+        LinearConstraint(rows(1, amount=portions[ENERGY_ROW], under=[[1]],
+                              over=[[-1]]), energy_low, energy_high),
+        # A food's amount is zero unless it is used, then within the limits.
+        LinearConstraint(rows(n_foods, amount=foods,
+                              used=-max_grams / 100 * foods), -np.inf, 0),
+        LinearConstraint(rows(n_foods, amount=foods,
+                              used=-min_grams / 100 * foods), 0, np.inf),
+        LinearConstraint(rows(1, used=np.ones((1, n_foods))), 0, max_foods)]
+
+    # Costs are relative to each target, exceeding a limit or leaving the
+    # energy band costs more than falling short of a green target.
+    cost = np.concatenate([np.full(n_foods, GRAMS_COST * 100),
+                           np.full(n_foods, FOOD_COST),
+                           SHORTFALL_COST / targets[reach],
+                           EXCESS_COST / targets[limit],
+                           np.full(2, EXCESS_COST / targets[ENERGY_ROW])])
+    integrality = np.concatenate([np.zeros(n_foods), np.ones(n_foods),
+                                  np.zeros(n_reach + n_limit + 2)])
+    bounds = Bounds(0, np.concatenate([np.full(n_foods, max_grams / 100),
+                                       np.ones(n_foods),
+                                       np.full(n_reach + n_limit + 2,
+                                               np.inf)]))
+    remaining = max(time_budget - (time.perf_counter() - start), 0.1)
+    result = milp(cost, constraints=constraints, integrality=integrality,
+                  bounds=bounds, options={'time_limit': remaining})
+
+    if result.x is None:
+        food_ids, grams = np.empty(0, dtype=np.int64), np.empty(0)
+    else:
+        portions = result.x[:n_foods]
+        used = (result.x[n_foods:2 * n_foods] > 0.5) & (portions > 1e-6)
+        food_ids, grams = candidates[used], portions[used] * 100
+    totals = np.nan_to_num(np.asarray(nutrients[food_ids], dtype=float)).T @ (
+        grams / 100)
+    return MealPlan(food_ids, grams, totals, rdi_profile, result.message,
+                    time.perf_counter() - start, n_foods)
+
+
+def init_worker(data_path):
+    """Points each worker process at the dataset, which it maps itself."""
+    nutrition_plotter.DATA_PATH = data_path
+
+
+def plan_profile(sex, weight, options):
+    """Plans one profile in a worker, returns its rows of the output."""
+    plan = plan_meals(get_rdi_profile(sex, weight), **options)
+    rows = plan.to_dataframe()
+    rows.insert(0, 'sex', sex)
+    rows.insert(1, 'weight', weight)
+    rows['status'] = plan.status
+    rows['seconds'] = round(plan.seconds, 2)
+    return rows
+
+
+def plan_profiles(profiles, data_path, workers, **options):
+    """Plans every (sex, weight) pair across a pool of worker processes."""
+
+    tasks = [(sex, weight, options) for sex, weight in profiles]
+    if workers == 1:
+        init_worker(data_path)
+        plans = [plan_profile(*task) for task in tasks]
+    else:
+        with multiprocessing.Pool(workers, initializer=init_worker,
+                                  initargs=(data_path,)) as pool:
+            plans = pool.starmap(plan_profile, tasks)
+    return pd.concat(plans, ignore_index=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Plans a day of foods meeting RDI targets.')
+    parser.add_argument('--sex', default='Male', choices=['Male', 'Female'])
+    parser.add_argument('--weight', type=float, default=70)
+    parser.add_argument('--profiles', help='CSV with sex and weight columns, '
+                                           'plans every row')
+    parser.add_argument('--output', help='CSV to write batch plans to')
+    parser.add_argument('--data', default=nutrition_plotter.DATA_PATH)
+    parser.add_argument('--workers', type=int,
+                        default=multiprocessing.cpu_count())
+    parser.add_argument('--max-foods', type=int, default=8)
+    parser.add_argument('--time-budget', type=float, default=5.,
+                        help='seconds allowed per plan')
+    parser.add_argument('--min-completeness', type=float, default=75)
+    args = parser.parse_args()
+
+    nutrition_plotter.DATA_PATH = args.data
+    get_food_store()
+    options = {'max_foods': args.max_foods, 'time_budget': args.time_budget,
+               'min_completeness': args.min_completeness}
+
+    if args.profiles:
+        profiles = pd.read_csv(args.profiles, usecols=['sex', 'weight'])
+        start = time.perf_counter()
+        plans = plan_profiles(profiles.itertuples(index=False, name=None),
+                              args.data, args.workers, **options)
+        print('{} profiles planned in {:.1f} s'.format(
+            len(profiles), time.perf_counter() - start))
+        if args.output:
+            plans.to_csv(args.output, index=False)
+        else:
+            print(plans.to_string())
+        return
+
+    plan = plan_meals(get_rdi_profile(args.sex, args.weight), **options)
+    print(plan.to_dataframe().to_string(index=False))
+    print('{} of {} candidate foods in {:.2f} s: {}'.format(
+        len(plan), plan.candidates, plan.seconds, plan.status))
+    shortfalls = plan.shortfalls()
+    if shortfalls:
+        print('Targets not reached: ' + ', '.join(shortfalls))
+    excesses = plan.excesses()
+    if excesses:
+        print('Limits exceeded: ' + ', '.join(excesses))
+
+
+if __name__ == '__main__':
+    main()
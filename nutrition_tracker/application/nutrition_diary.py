@@ -0,0 +1,202 @@
+import datetime
+import os
+import time
+import numpy as np
+import pandas as pd
+from nutrition_plotter import get_food_store
+from profiling import profiled
+
+# Each diary change is stored as one fixed size record. Removals refer to the
+# index of the entry they remove.
+RECORD_DTYPE = np.dtype([('op', 'u1'), ('timestamp', '<i8'),
+                         ('food_id', '<i4'), ('grams', '<f4'),
+                         ('entry', '<i4')])
+OP_ADD, OP_REMOVE = 0, 1
+
+
+def day_number(timestamp):
+    """Converts a Unix timestamp to the local date's ordinal."""
+    return datetime.date.fromtimestamp(timestamp).toordinal()
+
+
+def as_day_number(day):
+    """Accepts a date, datetime or date ordinal, returns the ordinal."""
+    if isinstance(day, (datetime.date, datetime.datetime)):
+        return day.toordinal()
+    return int(day)
+
+
+class NutritionDiary:
+    """An append-only log of (timestamp, food_id, grams) entries held in NumPy
+    arrays, with a running total of each nutrient kept for every day.
+
+    Adding or removing an entry updates that day's totals in place, so
+    totals for a day or a range of days never re-sum the log. When a path is
+    given, every change is appended to that file and replayed on start-up."""
+
+    def __init__(self, path=None, nutrients=None, nutrient_names=None,
+                 capacity=256):
+        if nutrients is None:
+            store = get_food_store()
+            nutrients, nutrient_names = store.nutrients, store.nutrient_names
+        self.nutrients = nutrients
+        self.nutrient_names = list(nutrient_names)
+
+        self.timestamps = np.zeros(capacity, dtype=np.int64)
+        self.food_ids = np.zeros(capacity, dtype=np.int32)
+        self.grams = np.zeros(capacity, dtype=np.float32)
+        self.active = np.zeros(capacity, dtype=bool)
+        self.size = 0
+        self.day_totals = {}
+        self._undo_stack = []
+
+        self.path = path
+        if path is not None and os.path.exists(path):
+            self._replay(np.fromfile(path, dtype=RECORD_DTYPE))
+
+    def __len__(self):
+        return int(self.active[:self.size].sum())
+
+    def _grow(self, size):
+        # Doubling the arrays keeps appends amortised O(1).
+        capacity = len(self.timestamps)
+        while capacity < size:
+            capacity *= 2
+        for name in ('timestamps', 'food_ids', 'grams', 'active'):
+            array = getattr(self, name)
+            grown = np.zeros(capacity, dtype=array.dtype)
+            grown[:len(array)] = array
+            setattr(self, name, grown)
+
+    def _amounts(self, food_id, grams):
+        """Nutrient amounts for a portion, missing values count as zero."""
+        return np.nan_to_num(np.asarray(self.nutrients[food_id],
+                                        dtype=float)) / 100 * grams
+
+    def _day_total(self, day):
+        if day not in self.day_totals:
+            self.day_totals[day] = np.zeros(len(self.nutrient_names))
+        return self.day_totals[day]
+
+    def _append_records(self, records):
+        if self.path is not None:
+            with open(self.path, 'ab') as file:
+                file.write(records.tobytes())
+
+    @profiled('diary add')
+    def add_food(self, food_id, grams, timestamp=None):
+        """Adds a portion of a food to the diary, returns the entry index."""
+
+        timestamp = int(time.time() if timestamp is None else timestamp)
+        entry = self.size
+        if entry == len(self.timestamps):
+            self._grow(entry + 1)
+        self.timestamps[entry] = timestamp
+        self.food_ids[entry] = food_id
+        self.grams[entry] = grams
+        self.active[entry] = True
+        self.size += 1
+        self._undo_stack.append(entry)
+
+        self._day_total(day_number(timestamp))[:] += self._amounts(food_id,
+                                                                   grams)
+        self._append_records(np.array([(OP_ADD, timestamp, food_id, grams,
+                                        entry)], dtype=RECORD_DTYPE))
+        return entry
+
+    def remove_entry(self, entry):
+        """Removes an entry, subtracting it from its day's totals."""
+
+        if not 0 <= entry < self.size or not self.active[entry]:
+            raise KeyError('No diary entry {}'.format(entry))
+        self.active[entry] = False
+        day = day_number(self.timestamps[entry])
+        self.day_totals[day] -= self._amounts(self.food_ids[entry],
+                                              self.grams[entry])
+        self._append_records(np.array([(OP_REMOVE, self.timestamps[entry],
+                                        self.food_ids[entry],
+                                        self.grams[entry], entry)],
+                                      dtype=RECORD_DTYPE))
+
+    def undo(self):
+        """Removes the most recently added entry still in the diary, returns
+        its index or None when there is nothing to undo."""
+
+        while self._undo_stack:
+            entry = self._undo_stack.pop()
+            if self.active[entry]:
+                self.remove_entry(entry)
+                return entry
+        return None
+
+    def _replay(self, records):
+        """Rebuilds the entry arrays and day totals from a saved log."""
+
+        adds = records[records['op'] == OP_ADD]
+        removes = records[records['op'] == OP_REMOVE]
+        self._grow(len(adds))
+        self.size = len(adds)
+        self.timestamps[:self.size] = adds['timestamp']
+        self.food_ids[:self.size] = adds['food_id']
+        self.grams[:self.size] = adds['grams']
+        self.active[:self.size] = True
+        self.active[removes['entry']] = False
+        self._undo_stack = list(np.flatnonzero(self.active[:self.size]))
+
+        # Summing every active entry into its day in one pass.
+        entries = np.flatnonzero(self.active[:self.size])
+        if len(entries) == 0:
+            return
+        days = np.array([day_number(timestamp) for timestamp
+                         in self.timestamps[entries]])
+        amounts = np.nan_to_num(np.asarray(
+            self.nutrients[self.food_ids[entries]], dtype=float))
+        amounts *= (self.grams[entries] / 100)[:, np.newaxis]
+        unique_days, day_index = np.unique(days, return_inverse=True)
+        totals = np.zeros((len(unique_days), len(self.nutrient_names)))
+        np.add.at(totals, day_index, amounts)
+        self.day_totals = {int(day): total
+                           for day, total in zip(unique_days, totals)}
+
+    def entries(self):
+        """Returns the active entries as a DataFrame indexed by entry."""
+
+        index = np.flatnonzero(self.active[:self.size])
+        return pd.DataFrame(
+            {'timestamp': pd.to_datetime(self.timestamps[index], unit='s'),
+             'food_id': self.food_ids[index],
+             'grams': self.grams[index]},
+            index=pd.Index(index, name='entry'))
+
+    def totals(self, day=None):
+        """Returns the nutrient totals for a day, today by default."""
+
+        if day is None:
+            day = datetime.date.today()
+        total = self.day_totals.get(as_day_number(day))
+        if total is None:
+            total = np.zeros(len(self.nutrient_names))
+        return pd.Series(total.copy(), index=self.nutrient_names)
+
+    def range_totals(self, start, end):
+        """Returns a DataFrame of nutrient totals for each day from start to
+        end inclusive, with a row of zeros for days without entries."""
+
+        first, last = as_day_number(start), as_day_number(end)
+        totals = np.zeros((last - first + 1, len(self.nutrient_names)))
+        for day, total in self.day_totals.items():
+            if first <= day <= last:
+                totals[day - first] = total
+        dates = [datetime.date.fromordinal(day)
+                 for day in range(first, last + 1)]
+        return pd.DataFrame(totals, index=dates, columns=self.nutrient_names)
+
+    def rdi_coverage(self, rdi_profile, day=None):
+        """Returns a day's totals as a percentage of each RDI target."""
+        totals = self.totals(day).to_numpy()
+        return rdi_profile.percentages(totals)[0]
+
+    @property
+    def diary(self):
+        """Today's nutrient totals, the Series plotted on the diary page."""
+        return self.totals()
@@ -1,15 +1,18 @@
+import functools
+import threading
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 from matplotlib.backends.backend_qt5agg import (FigureCanvasQTAgg
                                                 as FigureCanvas)
+from food_store import load_food_store
+from profiling import profiled, stage
+from search_index import IncrementalSearch, SearchIndex
 
-df = pd.read_csv('nutrition_data.csv', index_col=0)
+DATA_PATH = 'nutrition_data.csv'
 
-rdi_df = pd.DataFrame(
-    columns=['Male', 'Female', 'Colour'],
-    index=df.columns[1:-2],
-    data=[[2500, 2000, '#C26862'],
+# Male RDI, female RDI and bar colour for each nutrient column, in order.
+RDI_DATA = [[2500, 2000, '#C26862'],
          [3700, 2700, '#589A5D'],
          [400, 400, '#C26862'],
          [16, 16, '#C26862'],
@@ -58,8 +61,146 @@ rdi_df = pd.DataFrame(
          [3400, 2600, '#589A5D'],
          [55, 55, '#589A5D'],
          [1500, 1500, '#C26862'],
-         [11, 8, '#589A5D']])
+         [11, 8, '#589A5D']]
 
+# Loaders may be called from background worker threads, the lock stops two
+# threads loading the same data at once.
+_load_lock = threading.RLock()
+_food_store = None
+_df = None
+_rdi_df = None
+
+def get_food_store():
+    """Opens the memory-mapped binary copy of the dataset on first use,
+    converting the CSV if it is new or has changed."""
+    
+    global _food_store
+    with _load_lock:
+        if _food_store is None:
+            _food_store = load_food_store(DATA_PATH)
+    return _food_store
+
+def get_df():
+    """Creates the food DataFrame the first time it is needed rather than
+    when the module is imported."""
+    
+    global _df
+    with _load_lock:
+        if _df is None:
+            _df = get_food_store().to_dataframe()
+    return _df
+
+def get_rdi_df():
+    """Creates the RDI DataFrame, indexed by the dataset's nutrient names."""
+    
+    global _rdi_df
+    with _load_lock:
+        if _rdi_df is None:
+            _rdi_df = pd.DataFrame(columns=['Male', 'Female', 'Colour'],
+                                   index=get_food_store().nutrient_names,
+                                   data=RDI_DATA)
+    return _rdi_df
+
+def __getattr__(name):
+    # Keeps 'nutrition_plotter.df' and 'nutrition_plotter.rdi_df' working
+    # while deferring the loading until they are first accessed.
+    if name == 'df':
+        return get_df()
+    elif name == 'rdi_df':
+        return get_rdi_df()
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__,
+                                                                    name))
+
+# Protein and amino acid RDIs are per kg bodyweight.
+WEIGHT_BASED_ROWS = slice(14, 24)
+
+# Colour codes index into this palette, 0 is used for bars without data or
+# without a target.
+COLOUR_PALETTE = np.array(['#efebe7', '#589A5D', '#C26862'])
+STATUS_OK, STATUS_NO_DATA, STATUS_NO_TARGET = 0, 1, 2
+
+def rdi_targets(rdi_df, sex, weight):
+    """Selects the male or female RDI values, applying weight based
+    variations in protein RDI."""
+    
+    targets = np.array(rdi_df.loc[:, sex], dtype=float)
+    targets[WEIGHT_BASED_ROWS] = targets[WEIGHT_BASED_ROWS] * weight
+    return targets
+
+def rdi_colour_codes(rdi_df):
+    """Converts the RDI colour column to COLOUR_PALETTE indices."""
+    
+    palette = {colour: code for code, colour in enumerate(COLOUR_PALETTE)}
+    return np.array([palette.get(colour, 0) for colour in rdi_df['Colour']],
+                    dtype=np.int8)
+
+RDI_PROFILE_CACHE_SIZE = 64
+
+class RdiProfile:
+    """One person's RDI targets as contiguous arrays, computed once per sex
+    and weight and shared by plots, the diary and search ranking. The arrays
+    are read-only as a profile may be in use in several places at once."""
+    
+    def __init__(self, rdi_df, sex, weight):
+        self.sex = sex
+        self.weight = weight
+        self.nutrient_names = list(rdi_df.index)
+        self.targets = np.ascontiguousarray(rdi_targets(rdi_df, sex, weight))
+        self.colour_codes = rdi_colour_codes(rdi_df)
+        
+        # Nutrients without a target, to reach (green) and to limit (red).
+        self.no_target = np.isnan(self.targets)
+        self.reach = (self.colour_codes == 1) & ~self.no_target
+        self.limit = (self.colour_codes == 2) & ~self.no_target
+        for array in (self.targets, self.colour_codes, self.no_target,
+                      self.reach, self.limit):
+            array.flags.writeable = False
+            
+    def percentages(self, values):
+        """Takes nutrient amounts (one row per food), returns the RDI
+        percentages, bar widths limited to 100%, colour codes and status
+        flags marking nutrients with no data or no target."""
+        
+        with np.errstate(invalid='ignore'):
+            percent = (values / self.targets) * 100
+        
+        status = np.full(percent.shape, STATUS_OK, dtype=np.int8)
+        status[..., self.no_target] = STATUS_NO_TARGET
+        status[np.isnan(values)] = STATUS_NO_DATA
+        missing = status != STATUS_OK
+        
+        # Limiting the bar size to 100% RDI, bars without data or a target
+        # are drawn full width in the background colour.
+        bar = np.where(missing, 100., np.minimum(percent, 100.))
+        colours = np.where(missing, 0, self.colour_codes).astype(np.int8)
+        return percent, bar, colours, status
+    
+    def coverage_scores(self, values):
+        """Scores nutrient amounts (one row per food) by the average share of
+        the green targets they reach, less the average share of the red
+        limits they use up. Missing values count as zero."""
+        
+        with np.errstate(invalid='ignore'):
+            percent = np.minimum(np.nan_to_num(values / self.targets), 1.)
+        return (percent[..., self.reach].mean(axis=-1)
+                - percent[..., self.limit].mean(axis=-1))
+
+@functools.lru_cache(maxsize=RDI_PROFILE_CACHE_SIZE)
+def get_rdi_profile(sex, weight):
+    """Returns the shared RDI profile for a sex and weight, keeping the most
+    recently used profiles."""
+    
+    return RdiProfile(get_rdi_df(), sex, weight)
+
+def rdi_profile_for(rdi_df, sex, weight):
+    """Uses the cached profile for the application's RDI table, building an
+    uncached one for any other table."""
+    
+    if rdi_df is _rdi_df:
+        return get_rdi_profile(sex, weight)
+    return RdiProfile(rdi_df, sex, weight)
+
+@profiled('plot data')
 def create_plot_vars(food_df, food_id, grams, rdi_df, 
                      advanced_view, sex, weight):
     """Creates all the datasets required create a nutrition plot, including
@@ -71,81 +212,96 @@ def create_plot_vars(food_df, food_id, grams, rdi_df,
         food_series = food_df
         food_name = 'Daily nutrition targets'
     else:
-        food_series = food_df.iloc[food_id, 1:-2].astype(float).copy(deep=True)
+        food_series = food_df.iloc[food_id, 1:-2].astype(float)
         food_series = (food_series / 100) * grams
         food_name = food_df.iloc[food_id, -2]
     
-    # Selecting male or female RDI series and applying weight based variations
-    # in protein RDI.
-    rdi_value_series = rdi_df.loc[:, sex].copy(deep=True)
-    rdi_value_series.iloc[14:24] = rdi_value_series.iloc[14:24] * weight
-    rdi_colour_series = rdi_df.loc[:, 'Colour'].copy(deep=True)   
-    
-    # Creating a Series for the food's percentage of RDI.
-    rdi_percent_bar = (food_series / rdi_value_series) * 100
-    rdi_percent_label = rdi_percent_bar.round(2).astype(str) + '%'
-    
-    # Limiting the bar size to 100% RDI.
-    rdi_percent_bar = rdi_percent_bar.apply(lambda x: 100. if x > 100 else x)
+    profile = rdi_profile_for(rdi_df, sex, weight)
+    percent, bar, colours, status = profile.percentages(
+        food_series.to_numpy(dtype=float))
     
-    # Formatting the bar when no data or RDI target is available.
-    for row in range(len(rdi_percent_bar)):
-        if np.isnan(food_series[row]) == True:
-            rdi_percent_bar[row] = 100
-            rdi_percent_label[row] = 'No data'
-            rdi_colour_series[row] = '#efebe7'
-        elif np.isnan(rdi_value_series[row]) == True:
-            rdi_percent_bar[row] = 100
-            rdi_percent_label[row] = 'No target'
-            rdi_colour_series[row] = '#efebe7'
+    labels = np.char.add(np.round(percent, 2).astype(str), '%')
+    labels[status == STATUS_NO_DATA] = 'No data'
+    labels[status == STATUS_NO_TARGET] = 'No target'
     
-    return (food_series, rdi_value_series, rdi_colour_series, 
-            rdi_percent_bar, rdi_percent_label, food_name)
+    index = food_series.index
+    return (food_series,
+            pd.Series(profile.targets, index=index, name=sex),
+            pd.Series(COLOUR_PALETTE[colours], index=index, name='Colour'),
+            pd.Series(bar, index=index),
+            pd.Series(labels, index=index),
+            food_name)
 
-def create_plot(ax, food_series, rdi_value_series, rdi_colour_series,
-                rdi_percent_bar, rdi_percent_label):
-    """Takes an axis and plot variables as input, produces a horizontal bar
-    plot on the input axis."""
+def create_plot_vars_batch(nutrients, food_ids, grams, rdi_df, sex, weight):
+    """Scores many foods against one person's RDI in a single pass. Takes the
+    per 100g nutrient matrix, an array of food ids and the grams of each food
+    (or one amount for all of them). Returns N x nutrient matrices of RDI
+    percentages, bar widths limited to 100%, COLOUR_PALETTE codes and status
+    flags (STATUS_OK, STATUS_NO_DATA or STATUS_NO_TARGET)."""
     
-    bars = ax.barh(range(len(food_series)),
-                   rdi_percent_bar,
-                   color=rdi_colour_series)
-
-    # Iterates through each bar's dimensions to determine an appropriate
-    # location for the percentage label. 
-    for bar in range(len(bars)):
-
-        width = bars[bar].get_width()
-        width = int(width)
+    food_ids = np.asarray(food_ids)
+    grams = np.broadcast_to(np.asarray(grams, dtype=float), food_ids.shape)
+    values = np.asarray(nutrients[food_ids], dtype=float)
+    values *= (grams / 100)[:, np.newaxis]
+    return rdi_profile_for(rdi_df, sex, weight).percentages(values)
 
-        if width < 40:
-            xloc = 6
-            align = 'left'
-        else:
-            xloc = 0
-            align = 'center'
-            width = width/2
+def bar_label_position(width):
+    """Places a percentage label inside wide bars and just after short
+    ones. Returns the label's x value, x offset in points and alignment."""
+    
+    width = int(width)
+    if width < 40:
+        return width, 6, 'left'
+    return width / 2, 0, 'center'
 
-        yloc = bars[bar].get_y() + bars[bar].get_height() / 2
+def ytick_labels(food_series):
+    """Formats each nutrient's name, amount and unit as a tick label."""
+    
+    return ['{0} - {1} {2}'.format(name.split('(')[0].strip(')'),
+                                   round(value, 2),
+                                   name.split('(')[1].strip(')'))
+            for name, value in zip(food_series.index, food_series)]
 
-        ax.annotate(
-            rdi_percent_label[bar], xy=(width, yloc), xytext=(xloc, 0),
+def create_plot(ax, n_bars):
+    """Takes an axis and creates an empty horizontal bar plot with a
+    percentage label for each bar, returning the bars and labels so they
+    can be updated by update_plot."""
+    
+    bars = ax.barh(range(n_bars), np.zeros(n_bars),
+                   color=COLOUR_PALETTE[0])
+    labels = []
+    for bar in bars:
+        yloc = bar.get_y() + bar.get_height() / 2
+        labels.append(ax.annotate(
+            '', xy=(0, yloc), xytext=(6, 0),
             textcoords="offset points",
-            horizontalalignment=align, verticalalignment='center',
-            weight='bold', clip_on=True, size=13)
-
-    ax.set_yticks(range(len(food_series)))
-    y_ticklabels = [
-        '{0} - {1} {2}'.format(name.split('(')[0].strip(')'),
-                               round(value,2), name.split('(')[1].strip(')')) 
-        for name, value in zip(food_series.index, food_series)
-        ]
-    ax.set_yticklabels(y_ticklabels, size=13)
+            horizontalalignment='left', verticalalignment='center',
+            weight='bold', clip_on=True, size=13))
+
+    ax.set_yticks(range(n_bars))
     ax.invert_yaxis()
     ax.set_xlim(0,100)
-    ax.set_ylim((len(food_series) -0.4), -0.6)
+    ax.set_ylim((n_bars -0.4), -0.6)
     ax.get_xaxis().set_visible(False)
     ax.set_facecolor('#efebe7')
+    return bars, labels
+
+def update_plot(ax, bars, labels, food_series, rdi_colour_series,
+                rdi_percent_bar, rdi_percent_label):
+    """Updates an axis created by create_plot with new plot variables,
+    changing bar widths, colours and labels in place."""
+    
+    for bar, label, width, colour, text in zip(
+            bars, labels, rdi_percent_bar, rdi_colour_series,
+            rdi_percent_label):
+        bar.set_width(width)
+        bar.set_color(colour)
+        xloc, offset, align = bar_label_position(width)
+        label.xy = (xloc, label.xy[1])
+        label.xyann = (offset, 0)
+        label.set_horizontalalignment(align)
+        label.set_text(text)
+    ax.set_yticklabels(ytick_labels(food_series), size=13)
 
 def regex_search(food_input, df):
     """Uses a regex expression to create a dataset of foods with matching 
@@ -164,95 +320,152 @@ def regex_search(food_input, df):
     result = result.sort_values(by='Completeness (%)', ascending=False)
     return result.iloc[:, -2:]
 
+def removed_rows(df):
+    """Flags the foods removed by release updates when df is the dataset
+    loaded from the food store, returns None for any other DataFrame."""
+    if df is _df:
+        return np.asarray(get_food_store().removed)
+    return None
+
+_search_index = None
+_search_index_df = None
 
-class NutritionDiary:
-    """A diary instance starts as an array of 0's, users can then add foods to
-    their diary instance to track their daily intake of each nutrient."""
+def get_search_index(df):
+    """Builds the inverted description index for a dataset on first use and
+    reuses it for later searches."""
     
-    def __init__(self):
-        self.diary = pd.Series(index=df.iloc[1, 1:-2].index, data=np.zeros(48))
+    global _search_index, _search_index_df
+    with _load_lock:
+        if _search_index is None or _search_index_df is not df:
+            _search_index = SearchIndex.from_dataframe(
+                df, removed=removed_rows(df))
+            _search_index_df = df
+    return _search_index
 
-    # Returns the sum of the nutrition diary and a specified food.
-    def add_food(self, food_df, food_id, grams):
-        self.diary += ((food_df.iloc[food_id, 1:-2].fillna(0) / 100) * grams)
+_incremental_search = None
 
+def get_incremental_search(df):
+    """Wraps the dataset's search index with a cache of recent queries, so
+    each keystroke narrows the previous result."""
+    
+    global _incremental_search
+    index = get_search_index(df)
+    with _load_lock:
+        if (_incremental_search is None
+                or _incremental_search.index is not index):
+            _incremental_search = IncrementalSearch(index)
+    return _incremental_search
 
-class Canvas(FigureCanvas):
-    """Bridges Matplotlib and PyQt, allowing plots to be displayed within a 
-    PyQt application."""
+@profiled('search')
+def search_food_ids(food_input, df, mode='index', rdi_profile=None,
+                    grams=100):
+    """Returns the row positions of foods with matching descriptions, ordered
+    by the availabilty of nutritional values. Each search word must match the
+    start of a word in the description. Setting mode to 'regex' falls back
+    to a full regex scan of every description. Given an RdiProfile, results
+    are instead ordered by how well the amount in grams meets that profile."""
     
-    def __init__(self, parent, *args, **kwargs):
-        fig, ((self.ax1, self.ax2),
-              (self.ax3, self.ax4),
-              (self.ax5, self.ax6)) = plt.subplots(
-                  3, 2,
-                  gridspec_kw={'width_ratios': [1, 1],
-                               'height_ratios': [1, 2, 3]},
-                  dpi=55,
-                  figsize=(15,19.8))
-        
-        fig.patch.set_facecolor('#efebe7')
-        super().__init__(fig)
-        self.setParent(parent)
-                
-        (food_series, rdi_value_series, rdi_colour_series, rdi_percent_bar,
-         rdi_percent_label, food_name) = create_plot_vars(*args, **kwargs)
-               
-        self.ax1.set_title('General', size=14)
-        create_plot(self.ax1,
-                    food_series[0:4],
-                    rdi_value_series[0:4],
-                    rdi_colour_series[0:4],
-                    rdi_percent_bar[0:4],
-                    rdi_percent_label[0:4])
-        
-        self.ax2.set_title('Carbohydrates', size=14)
-        create_plot(self.ax2,
-                    food_series[4:8],
-                    rdi_value_series[4:8],
-                    rdi_colour_series[4:8],
-                    rdi_percent_bar[4:8],
-                    rdi_percent_label[4:8])
-        
-        self.ax3.set_title('Fats', size=14)
-        create_plot(self.ax3,
-                    food_series[8:14],
-                    rdi_value_series[8:14],
-                    rdi_colour_series[8:14],
-                    rdi_percent_bar[8:14],
-                    rdi_percent_label[8:14])
-        
-        self.ax4.set_title('Proteins', size=14)
-        create_plot(self.ax4,
-                    food_series[14:23],
-                    rdi_value_series[14:23],
-                    rdi_colour_series[14:23],
-                    rdi_percent_bar[14:23],
-                    rdi_percent_label[14:23])
-        
-        self.ax5.set_title('Vitamins', size=14)
-        create_plot(self.ax5,
-                    food_series[24:37],
-                    rdi_value_series[24:37],
-                    rdi_colour_series[24:37],
-                    rdi_percent_bar[24:37],
-                    rdi_percent_label[24:37])
+    if mode == 'regex':
+        food_ids = df.index.get_indexer(regex_search(food_input, df).index)
+        removed = removed_rows(df)
+        if removed is not None:
+            food_ids = food_ids[~removed[food_ids]]
+    elif mode == 'index':
+        food_ids = get_incremental_search(df).search(food_input)
+    else:
+        raise ValueError('Unknown search mode: {}'.format(mode))
+    
+    if rdi_profile is not None and len(food_ids):
+        values = df.iloc[food_ids, 1:-2].to_numpy(dtype=float) / 100 * grams
+        scores = rdi_profile.coverage_scores(values)
+        food_ids = food_ids[np.argsort(-scores, kind='stable')]
+    return food_ids
+
+def search_foods(food_input, df, **kwargs):
+    """Creates a dataset of the Description and Completeness (%) of foods
+    matching the search, see search_food_ids."""
+    
+    return df.iloc[search_food_ids(food_input, df, **kwargs), -2:]
+
+
+# Resolution and size of the chart figure, 825 x 1089 pixels.
+CHART_DPI = 55
+CHART_SIZE = (15, 19.8)
+
+# The title and nutrient rows shown on each of the six axes.
+CHART_SECTIONS = [('General', slice(0, 4)),
+                  ('Carbohydrates', slice(4, 8)),
+                  ('Fats', slice(8, 14)),
+                  ('Proteins', slice(14, 23)),
+                  ('Vitamins', slice(24, 37)),
+                  ('Minerals', slice(37, 48))]
+
+
+class NutritionChart:
+    """Builds the six nutrition plots on a Matplotlib figure once. Showing a
+    different food only updates the existing bars, labels and title."""
+    
+    def __init__(self, fig):
+        self.fig = fig
+        self.fig.patch.set_facecolor('#efebe7')
+        axes = fig.subplots(3, 2,
+                            gridspec_kw={'width_ratios': [1, 1],
+                                         'height_ratios': [1, 2, 3]})
         
-        self.ax6.set_title('Minerals', size=14)
-        create_plot(self.ax6,
-                    food_series[37:],
-                    rdi_value_series[37:],
-                    rdi_colour_series[37:],
-                    rdi_percent_bar[37:],
-                    rdi_percent_label[37:])
+        self.plots = []
+        for ax, (title, rows) in zip(axes.flat, CHART_SECTIONS):
+            ax.set_title(title, size=14)
+            bars, labels = create_plot(ax, rows.stop - rows.start)
+            self.plots.append((ax, rows, bars, labels))
         
-        plt.suptitle(food_name.capitalize(), size=18)        
+        self.title = fig.suptitle('', size=18)
         fig.subplots_adjust(left = 0.2,
                             right = 0.995,
                             top=0.95,
                             wspace=0.5,
                             hspace=0.07)
-
+    
+    def update(self, food_series, rdi_value_series, rdi_colour_series,
+               rdi_percent_bar, rdi_percent_label, food_name):
+        """Takes the outputs of create_plot_vars and redraws the plots."""
         
-		
+        for ax, rows, bars, labels in self.plots:
+            update_plot(ax, bars, labels,
+                        food_series.iloc[rows],
+                        rdi_colour_series.iloc[rows],
+                        rdi_percent_bar.iloc[rows],
+                        rdi_percent_label.iloc[rows])
+        self.title.set_text(food_name.capitalize())
+
 
+class Canvas(FigureCanvas):
+    """Bridges Matplotlib and PyQt, allowing plots to be displayed within a 
+    PyQt application. The figure is built once, update_chart then replaces
+    the plotted food."""
+    
+    def __init__(self, parent, *args, **kwargs):
+        fig = Figure(dpi=CHART_DPI, figsize=CHART_SIZE)
+        super().__init__(fig)
+        self.setParent(parent)
+        self.chart = NutritionChart(fig)
+        if args or kwargs:
+            self.update_chart(*args, **kwargs)
+            
+    def update_chart(self, *args, **kwargs):
+        """Takes the arguments of create_plot_vars, updates the plots and
+        schedules a redraw."""
+        
+        self.show_plot_vars(create_plot_vars(*args, **kwargs))
+    
+    def show_plot_vars(self, plot_vars):
+        """Updates the plots with precomputed create_plot_vars outputs and
+        draws the figure."""
+        
+        self.chart.update(*plot_vars)
+        self.draw_idle()
+    
+    def draw(self):
+        """Renders the figure, timed as the 'figure draw' stage."""
+        
+        with stage('figure draw'):
+            super().draw()
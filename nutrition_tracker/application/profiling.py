@@ -0,0 +1,152 @@
+"""Opt-in latency histograms for the application's stages.
+
+    NUTRITION_PROFILE=1 python main.py            # prints a summary on exit
+    NUTRITION_PROFILE=profile.json python main.py # also writes the histograms
+    python main.py --profile
+
+Stages are timed with stage('search') blocks or the profiled decorator. When
+profiling is off they cost one flag check. Latencies go into histograms with
+log spaced buckets, so memory stays fixed however long the application runs.
+"""
+import atexit
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+import numpy as np
+
+ENV_VAR = 'NUTRITION_PROFILE'
+
+# Bucket edges in seconds, 20 per decade from 10 microseconds to 100 s.
+BUCKET_EDGES = np.logspace(-5, 2, 141)
+
+
+class LatencyHistogram:
+    """Counts latencies in the BUCKET_EDGES buckets, the first and last
+    buckets also holding anything below or above the edges."""
+
+    def __init__(self):
+        self.counts = np.zeros(len(BUCKET_EDGES) - 1, dtype=np.int64)
+        self.total = 0.
+        self.maximum = 0.
+
+    def add(self, seconds):
+        bucket = np.searchsorted(BUCKET_EDGES, seconds, side='right') - 1
+        self.counts[min(max(bucket, 0), len(self.counts) - 1)] += 1
+        self.total += seconds
+        self.maximum = max(self.maximum, seconds)
+
+    def __len__(self):
+        return int(self.counts.sum())
+
+    def percentile(self, q):
+        """Estimates a percentile from the buckets, in seconds, at the
+        geometric middle of the bucket it falls in."""
+        cumulative = np.cumsum(self.counts)
+        bucket = int(np.searchsorted(cumulative, q / 100 * cumulative[-1]))
+        middle = np.sqrt(BUCKET_EDGES[bucket] * BUCKET_EDGES[bucket + 1])
+        return min(middle, self.maximum)
+
+
+_lock = threading.Lock()
+_histograms = {}
+_enabled = False
+_dump_path = None
+
+
+def enable(dump_path=None):
+    """Starts recording. On exit the summary is printed and, given a path,
+    the histograms are written to it as JSON."""
+    global _enabled, _dump_path
+    if not _enabled:
+        atexit.register(dump)
+    _enabled = True
+    _dump_path = dump_path
+
+
+def is_enabled():
+    return _enabled
+
+
+def record(name, seconds):
+    """Adds one latency in seconds to a stage's histogram."""
+    if not _enabled:
+        return
+    with _lock:
+        if name not in _histograms:
+            _histograms[name] = LatencyHistogram()
+        _histograms[name].add(seconds)
+
+
+@contextlib.contextmanager
+def _timed(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def stage(name):
+    """Times the block it wraps as one latency of the named stage."""
+    return _timed(name) if _enabled else contextlib.nullcontext()
+
+
+def profiled(name):
+    """Decorates a function so each call is timed as the named stage."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            with _timed(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def summary():
+    """Returns {stage: (count, mean ms, median ms, 95th percentile ms,
+    99th percentile ms, max ms)}."""
+    with _lock:
+        return {name: (len(histogram),
+                       histogram.total / len(histogram) * 1000,
+                       histogram.percentile(50) * 1000,
+                       histogram.percentile(95) * 1000,
+                       histogram.percentile(99) * 1000,
+                       histogram.maximum * 1000)
+                for name, histogram in sorted(_histograms.items())}
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+
+
+def dump(path=None):
+    """Prints the summary and writes the bucket edges and each stage's
+    counts to path, or to the path given to enable."""
+
+    path = path or _dump_path
+    print('{:<28}{:>8}{:>10}{:>10}{:>10}{:>10}{:>10}'.format(
+        'Stage', 'Count', 'Mean ms', 'p50 ms', 'p95 ms', 'p99 ms', 'Max ms'))
+    for name, values in summary().items():
+        print('{:<28}{:>8}'.format(name, values[0])
+              + ''.join('{:>10.2f}'.format(value) for value in values[1:]))
+    if path:
+        with _lock:
+            histograms = {name: {'counts': histogram.counts.tolist(),
+                                 'total_s': histogram.total,
+                                 'max_s': histogram.maximum}
+                          for name, histogram in _histograms.items()}
+        with open(path, 'w') as file:
+            json.dump({'bucket_edges_s': BUCKET_EDGES.tolist(),
+                       'stages': histograms}, file, indent=1)
+
+
+# Profiling from the environment, '1' prints the summary, a path also
+# writes the histograms there.
+if os.environ.get(ENV_VAR):
+    enable(None if os.environ[ENV_VAR] == '1' else os.environ[ENV_VAR])
@@ -0,0 +1,250 @@
+import collections
+import re
+import threading
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+
+def tokenize(text):
+    """Splits a description or search query into lowercase word tokens."""
+    return TOKEN_PATTERN.findall(str(text).lower())
+
+
+def intersect_sorted(a, b):
+    """Intersects two sorted arrays of unique values by binary searching the
+    shorter array's values in the longer one."""
+    if len(a) > len(b):
+        a, b = b, a
+    if len(a) == 0:
+        return a
+    positions = np.minimum(np.searchsorted(b, a), len(b) - 1)
+    return a[b[positions] == a]
+
+
+class SearchIndex:
+    """An inverted index mapping each lowercase description token to a sorted
+    posting list of foods, used in place of a regex scan over every row.
+
+    Posting lists hold each food's rank by 'Completeness (%)' rather than its
+    row id, so the intersection of several posting lists is already ordered
+    with the most complete foods first. Foods flagged in 'removed' keep
+    their rank but are left out of every posting list."""
+
+    def __init__(self, descriptions, completeness, prefix_cache_length=3,
+                 removed=None):
+        descriptions = list(descriptions)
+        completeness = np.asarray(completeness, dtype=float)
+        if removed is None:
+            removed = np.zeros(len(descriptions), dtype=bool)
+
+        # Ordering foods by completeness (descending), ties keep row order.
+        self.rank_to_row = np.argsort(-np.nan_to_num(completeness, nan=-1.),
+                                      kind='stable').astype(np.int64)
+        self.prefix_cache_length = prefix_cache_length
+        self._prefix_cache = {}
+        self.live_ranks = np.flatnonzero(
+            ~np.asarray(removed)[self.rank_to_row]).astype(np.int32)
+
+        # Appending ranks in increasing order keeps each posting list sorted.
+        postings = {}
+        for rank, row in zip(self.live_ranks.tolist(),
+                             self.rank_to_row[self.live_ranks].tolist()):
+            for token in set(tokenize(descriptions[row])):
+                postings.setdefault(token, []).append(rank)
+
+        # Storing the posting lists as one flat array with offsets per token.
+        vocabulary = sorted(postings)
+        lengths = [len(postings[token]) for token in vocabulary]
+        self.offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        self.offsets[1:] = np.cumsum(lengths)
+        self.postings = np.fromiter(
+            (rank for token in vocabulary for rank in postings[token]),
+            dtype=np.int32, count=int(self.offsets[-1]))
+        self.vocabulary = np.array(vocabulary, dtype=str)
+
+        # A forward index listing each rank's token ids, used to narrow an
+        # existing result set without touching the posting lists.
+        token_ids = np.repeat(np.arange(len(vocabulary), dtype=np.int32),
+                              lengths)
+        order = np.argsort(self.postings, kind='stable')
+        self.rank_tokens = token_ids[order]
+        self.rank_offsets = np.zeros(len(self.rank_to_row) + 1,
+                                     dtype=np.int64)
+        self.rank_offsets[1:] = np.cumsum(
+            np.bincount(self.postings, minlength=len(self.rank_to_row)))
+        self.mean_tokens = len(self.postings) / max(len(self.rank_to_row), 1)
+
+    @classmethod
+    def from_dataframe(cls, df, **kwargs):
+        """Builds an index from the Description and Completeness columns."""
+        return cls(df['Description'], df['Completeness (%)'], **kwargs)
+
+    def token_postings(self, token):
+        """Returns the posting list for an exact token."""
+        position = np.searchsorted(self.vocabulary, token)
+        if (position < len(self.vocabulary)
+                and self.vocabulary[position] == token):
+            return self.postings[self.offsets[position]:
+                                 self.offsets[position + 1]]
+        return np.empty(0, dtype=np.int32)
+
+    def prefix_range(self, prefix):
+        """Returns the range of token ids starting with the prefix. The
+        vocabulary is sorted so all tokens sharing a prefix are adjacent."""
+        return (int(np.searchsorted(self.vocabulary, prefix)),
+                int(np.searchsorted(self.vocabulary, prefix + '\uffff')))
+
+    def has_postings_ready(self, prefix):
+        """Checks whether a prefix's posting list can be returned without
+        merging several tokens' lists."""
+        if prefix in self._prefix_cache:
+            return True
+        start, stop = self.prefix_range(prefix)
+        return stop - start <= 1
+
+    def prefix_postings(self, prefix):
+        """Returns the sorted union of the posting lists of every token
+        starting with the prefix."""
+        if prefix in self._prefix_cache:
+            return self._prefix_cache[prefix]
+
+        start, stop = self.prefix_range(prefix)
+        result = self.postings[self.offsets[start]:self.offsets[stop]]
+        if stop - start > 1:
+            result = np.unique(result)
+
+        # Short prefixes match many tokens, so their unions are kept.
+        if len(prefix) <= self.prefix_cache_length:
+            self._prefix_cache[prefix] = result
+        return result
+
+    def search_ranks(self, query):
+        """Returns the completeness ranks of foods matching every word of the
+        query, where each word may be a whole token or a token prefix."""
+        words = tokenize(query)
+        if not words:
+            return self.live_ranks
+
+        # Intersecting the shortest posting lists first.
+        posting_lists = sorted((self.prefix_postings(word) for word in words),
+                               key=len)
+        result = posting_lists[0]
+        for posting_list in posting_lists[1:]:
+            if len(result) == 0:
+                break
+            result = intersect_sorted(result, posting_list)
+        return result
+
+    def search(self, query):
+        """Returns the row ids of matching foods, most complete first."""
+        return self.rank_to_row[self.search_ranks(query)]
+
+    def warm_prefixes(self, length=2):
+        """Computes the posting lists of every prefix up to a length ahead of
+        time, as the first keystrokes of a search match the most tokens."""
+        for size in range(1, min(length, self.prefix_cache_length) + 1):
+            for prefix in sorted({token[:size] for token in self.vocabulary}):
+                self.prefix_postings(prefix)
+
+    def filter_ranks(self, ranks, word):
+        """Keeps the ranks whose description has a token starting with the
+        word, checking each rank's own tokens."""
+        start, stop = self.prefix_range(word)
+        if len(ranks) == 0 or start == stop:
+            return ranks[:0]
+
+        counts = self.rank_offsets[ranks + 1] - self.rank_offsets[ranks]
+        ranks, counts = ranks[counts > 0], counts[counts > 0]
+        if len(ranks) == 0:
+            return ranks
+
+        # Gathering every token id of every rank into one flat array.
+        first = np.cumsum(counts) - counts
+        positions = (np.arange(counts.sum())
+                     - np.repeat(first, counts)
+                     + np.repeat(self.rank_offsets[ranks], counts))
+        token_ids = self.rank_tokens[positions]
+        hits = (token_ids >= start) & (token_ids < stop)
+        return ranks[np.add.reduceat(hits, first) > 0]
+
+
+class IncrementalSearch:
+    """Answers search-as-you-type queries from a SearchIndex.
+
+    Results for recent queries are kept in a bounded LRU cache. When a query
+    extends a cached one (each cached word is the start of a word in the new
+    query) the cached result is narrowed by checking only the new or longer
+    words against each remaining food, rather than searching again."""
+
+    def __init__(self, index, cache_size=256):
+        self.index = index
+        self.cache_size = cache_size
+        self.cache = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def _cached(self, words):
+        with self._lock:
+            result = self.cache.get(words)
+            if result is not None:
+                self.cache.move_to_end(words)
+            return result
+
+    def _store(self, words, ranks):
+        with self._lock:
+            self.cache[words] = ranks
+            self.cache.move_to_end(words)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def _narrowest_ancestor(self, words):
+        """Finds the smallest cached result that contains every result of
+        the new query."""
+        with self._lock:
+            cached = list(self.cache.items())
+        best = None
+        for cached_words, ranks in cached:
+            if all(any(word.startswith(cached_word) for word in words)
+                   for cached_word in cached_words):
+                if best is None or len(ranks) < len(best[1]):
+                    best = (cached_words, ranks)
+        return best
+
+    def _narrow(self, ranks, word):
+        # Checking each remaining food's tokens costs time in proportion to
+        # the remaining results, intersecting with the word's postings in
+        # proportion to the postings, so the cheaper of the two is used.
+        index = self.index
+        start, stop = index.prefix_range(word)
+        postings = index.offsets[stop] - index.offsets[start]
+        if (index.has_postings_ready(word)
+                or postings < len(ranks) * index.mean_tokens):
+            return intersect_sorted(ranks, index.prefix_postings(word))
+        return index.filter_ranks(ranks, word)
+
+    def search_ranks(self, query):
+        """Returns the completeness ranks of foods matching the query."""
+        words = tuple(sorted(set(tokenize(query))))
+        ranks = self._cached(words)
+        if ranks is not None:
+            return ranks
+
+        # A single word whose postings are ready needs no narrowing.
+        ancestor = None
+        if len(words) > 1 or (words
+                              and not self.index.has_postings_ready(words[0])):
+            ancestor = self._narrowest_ancestor(words)
+
+        if ancestor is None:
+            ranks = self.index.search_ranks(query)
+        else:
+            cached_words, ranks = ancestor
+            for word in words:
+                if word not in cached_words:
+                    ranks = self._narrow(ranks, word)
+        self._store(words, ranks)
+        return ranks
+
+    def search(self, query):
+        """Returns the row ids of matching foods, most complete first."""
+        return self.index.rank_to_row[self.search_ranks(query)]
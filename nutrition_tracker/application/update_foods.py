@@ -0,0 +1,34 @@
+"""Applies a release delta to the food store in place.
+
+    python update_foods.py delta.npz --data nutrition_data.csv
+
+Food ids saved in the diary stay valid: changed foods keep their row, new
+foods are added after the existing ones and removed foods are hidden from
+search but keep their nutrients. The search index is built from the patched
+store the next time the application starts.
+"""
+import argparse
+import time
+import nutrition_plotter
+from food_store import apply_delta
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Applies a release delta to the food store.')
+    parser.add_argument('delta', help='.npz delta written by delta.py')
+    parser.add_argument('--data', default=nutrition_plotter.DATA_PATH,
+                        help='nutrition_data.csv whose store is patched')
+    args = parser.parse_args()
+
+    # Opening the store first builds it if it does not exist yet.
+    nutrition_plotter.DATA_PATH = args.data
+    store_dir = nutrition_plotter.get_food_store().store_dir
+    start = time.perf_counter()
+    counts = apply_delta(store_dir, args.delta)
+    print('{changed} changed, {added} added, {removed} removed'.format(
+        **counts), 'in {:.2f} s'.format(time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+import collections
+import time
+import numpy as np
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+import profiling
+
+LATENCY_HISTORY = 1000
+
+
+class TaskSignals(QObject):
+    """Signals emitted from pool threads. The object lives in the GUI thread
+    so connected slots run there."""
+    finished = pyqtSignal(str, int, object)
+    failed = pyqtSignal(str, int, object)
+
+
+class Task(QRunnable):
+    """Runs one function call on a pool thread, skipping it when a newer
+    request of the same kind has been submitted in the meantime."""
+
+    def __init__(self, worker, kind, request_id, function, args, kwargs):
+        super().__init__()
+        self.worker = worker
+        self.kind = kind
+        self.request_id = request_id
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.submitted = time.perf_counter()
+
+    def run(self):
+        started = time.perf_counter()
+        if self.worker.is_stale(self.kind, self.request_id):
+            return
+        try:
+            result = self.function(*self.args, **self.kwargs)
+        except Exception as error:
+            self.worker.signals.failed.emit(self.kind, self.request_id, error)
+            return
+        finished = time.perf_counter()
+        self.worker.record(self.kind, 'queue', started - self.submitted)
+        self.worker.record(self.kind, 'compute', finished - started)
+        self.worker.signals.finished.emit(self.kind, self.request_id,
+                                          (result, finished))
+
+
+class BackgroundWorker(QObject):
+    """Runs searches and plot-data computation on a QThreadPool so the Qt
+    event loop never waits on them.
+
+    Requests are grouped by kind ('search', 'plot', ...). Submitting a new
+    request makes older requests of the same kind stale: queued ones are
+    skipped when they reach a thread and the results of running ones are
+    dropped, so only the latest result is delivered through result_ready.
+    Requests queued with submit_always, such as saving, are never stale.
+    Queue, compute and paint latencies are kept per kind for
+    latency_summary."""
+
+    result_ready = pyqtSignal(str, int, object)
+    error = pyqtSignal(str, int, object)
+
+    def __init__(self, max_threads=None, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        if max_threads is not None:
+            self.pool.setMaxThreadCount(max_threads)
+        self.signals = TaskSignals(self)
+        self.signals.finished.connect(self._on_finished)
+        self.signals.failed.connect(self._on_failed)
+        self.latest = {}
+        self.delivered = {}
+        self.latencies = collections.defaultdict(
+            lambda: collections.deque(maxlen=LATENCY_HISTORY))
+
+    def submit(self, kind, function, *args, **kwargs):
+        """Queues function(*args, **kwargs), returns the request id."""
+
+        request_id = self.latest.get(kind, 0) + 1
+        self.latest[kind] = request_id
+        self.pool.start(Task(self, kind, request_id, function, args, kwargs))
+        return request_id
+
+    def submit_always(self, kind, function, *args, **kwargs):
+        """Queues function(*args, **kwargs) as a request that newer ones
+        never make stale, so every call runs. Its request id is 0."""
+        self.pool.start(Task(self, kind, 0, function, args, kwargs))
+        return 0
+
+    def is_stale(self, kind, request_id):
+        """Checks whether a newer request of the same kind exists."""
+        return request_id != 0 and request_id != self.latest.get(kind)
+
+    def record(self, kind, stage, seconds):
+        """Records a latency in seconds for a kind of request and a stage,
+        one of 'queue', 'compute' or 'paint'."""
+        self.latencies[(kind, stage)].append(seconds)
+        profiling.record('{} {}'.format(kind, stage), seconds)
+
+    def record_paint(self, kind, request_id):
+        """Records the time from a result being computed to the caller
+        having painted it, call once painting is done."""
+        finished = self.delivered.pop((kind, request_id), None)
+        if finished is not None:
+            self.record(kind, 'paint', time.perf_counter() - finished)
+
+    def latency_summary(self):
+        """Returns {(kind, stage): (count, median ms, 95th percentile ms)}."""
+        return {key: (len(values),
+                      float(np.percentile(values, 50)) * 1000,
+                      float(np.percentile(values, 95)) * 1000)
+                for key, values in self.latencies.items() if values}
+
+    def _on_finished(self, kind, request_id, output):
+        if self.is_stale(kind, request_id):
+            return
+        result, finished = output
+        self.delivered[(kind, request_id)] = finished
+        self.result_ready.emit(kind, request_id, result)
+
+    def _on_failed(self, kind, request_id, error):
+        if not self.is_stale(kind, request_id):
+            self.error.emit(kind, request_id, error)
+
+    def wait(self, msecs=-1):
+        """Blocks until every running task has finished."""
+        return self.pool.waitForDone(msecs)
@@ -0,0 +1,234 @@
+"""Benchmarks the application's hot paths headless on a synthetic dataset,
+so regressions in speed and memory show up as numbers.
+
+    python benchmarks/hot_path_benchmark.py
+    python benchmarks/hot_path_benchmark.py --save baseline.json
+    python benchmarks/hot_path_benchmark.py --compare baseline.json
+
+Search, table build, plot data, figure draw and diary add are each called
+for a number of rounds, or until --max-time, after a warm-up, as
+pytest-benchmark does. The min, median, mean and max times, calls per second
+and growth in peak RSS are reported. Qt runs on the offscreen platform.
+Unless --data is given, a 500,000 food dataset with the application's layout
+is generated once in the temp directory. Against a saved run, cases slower or
+larger by more than --tolerance are listed and the script exits with
+status 1.
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'application'))
+
+from PyQt5.QtCore import Qt
+from PyQt5.QtWidgets import QApplication, QWidget
+import nutrition_plotter
+from food_table_model import FoodTableModel
+from nutrition_diary import NutritionDiary
+from nutrition_plotter import (Canvas, create_plot_vars, get_df,
+                               get_food_store, get_rdi_df, get_search_index)
+
+WORDS = ['cheese', 'cheddar', 'milk', 'whole', 'skimmed', 'apple', 'juice',
+         'bread', 'white', 'wheat', 'chicken', 'breast', 'raw', 'cooked',
+         'beef', 'ground', 'chocolate', 'bar', 'orange', 'yogurt', 'greek',
+         'plain', 'soup', 'tomato', 'rice', 'brown', 'pasta', 'egg',
+         'butter', 'peanut', 'salted', 'frozen', 'fried', 'roasted']
+QUERIES = ['cheese', 'cheddar cheese', 'whole milk', 'chicken breast raw',
+           'apple', 'bread white', 'chocolate bar', 'orange juice',
+           'greek yogurt plain', 'beef ground cooked']
+MIN_ROUNDS = 5
+UNITS = ['kcal', 'g', 'mg', 'g', 'g', 'g', 'g', 'g', 'g', 'g', 'g', 'g', 'g',
+         'mg', 'g'] + ['g'] * 9 + ['mg'] * 24
+
+
+def write_synthetic_dataset(path, rows, seed=0):
+    """Writes a nutrition_data.csv of random foods: 48 nutrients with 40%
+    missing, descriptions of two to six words and completeness."""
+
+    rng = np.random.default_rng(seed)
+    names = ['Nutrient {} ({})'.format(number, unit)
+             for number, unit in enumerate(UNITS)]
+    values = rng.gamma(1.0, 20, (rows, len(names)))
+    values[rng.random(values.shape) < 0.4] = np.nan
+    words = np.array(WORDS)[rng.integers(0, len(WORDS), (rows, 6))]
+    lengths = rng.integers(2, 7, rows)
+    descriptions = [' '.join(food_words[:length]) for food_words, length
+                    in zip(words, lengths)]
+
+    dataset = pd.DataFrame(values, columns=names)
+    dataset.insert(0, 'fdc_id', np.arange(rows) + 100000)
+    dataset['Description'] = descriptions
+    dataset['Completeness (%)'] = (dataset[names].notnull().sum(axis=1)
+                                   / len(names) * 100).round(1)
+    dataset.to_csv(path)
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_case(function, rounds, warmup, max_time):
+    """Calls function(round) warmup times untimed, then up to rounds times,
+    stopping early after max_time seconds but never before MIN_ROUNDS.
+    Returns its statistics in milliseconds and the peak RSS growth."""
+
+    for round_number in range(warmup):
+        function(round_number)
+    rss = peak_rss_mb()
+    times = []
+    deadline = time.perf_counter() + max_time
+    for round_number in range(rounds):
+        start = time.perf_counter()
+        function(round_number)
+        times.append(time.perf_counter() - start)
+        if len(times) >= MIN_ROUNDS and time.perf_counter() > deadline:
+            break
+    times = np.array(times) * 1000
+    return {'rounds': len(times), 'min_ms': times.min(),
+            'median_ms': float(np.median(times)), 'mean_ms': times.mean(),
+            'max_ms': times.max(), 'ops_per_s': 1000 / times.mean(),
+            'rss_growth_mb': peak_rss_mb() - rss}
+
+
+def hot_path_cases(app, seed, diary_path):
+    """The benchmarked calls, each taking the round number. The diary is
+    saved to diary_path, as the application saves its own."""
+
+    df, rdi_df, store = get_df(), get_rdi_df(), get_food_store()
+    index = get_search_index(df)
+    rng = np.random.default_rng(seed)
+    food_ids = rng.integers(0, len(df), 1000)
+    results = [index.search(query) for query in QUERIES]
+
+    model = FoodTableModel(store)
+    page = QWidget()
+    page.resize(835, 969)
+    page.chart = Canvas(page)
+    page.show()
+    plot_vars = [create_plot_vars(df, food_id, 100, rdi_df, True, 'Male', 70)
+                 for food_id in food_ids[:10]]
+    diary = NutritionDiary(diary_path)
+
+    def search(round_number):
+        # The index itself, the incremental search would cache repeats.
+        index.search(QUERIES[round_number % len(QUERIES)])
+
+    def table_build(round_number):
+        # Resetting the model and formatting the rows of the first screen.
+        model.set_food_ids(results[round_number % len(results)])
+        for row in range(min(40, model.rowCount())):
+            for column in range(2):
+                model.data(model.index(row, column), Qt.DisplayRole)
+
+    def plot_data(round_number):
+        create_plot_vars(df, food_ids[round_number % len(food_ids)], 100,
+                         rdi_df, True, 'Male', 70)
+
+    def figure_draw(round_number):
+        # show_plot_vars queues one draw, run by the event loop as in the
+        # application.
+        page.chart.show_plot_vars(plot_vars[round_number % len(plot_vars)])
+        app.processEvents()
+
+    def diary_add(round_number):
+        diary.add_food(int(food_ids[round_number % len(food_ids)]), 100)
+
+    return {'search': search, 'table build': table_build,
+            'plot data': plot_data, 'figure draw': figure_draw,
+            'diary add': diary_add}
+
+
+def compare(results, baseline, tolerance):
+    """Lists the cases slower or with more RSS growth than the baseline
+    by more than the tolerance, a fraction."""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]
+        if result['median_ms'] > before['median_ms'] * (1 + tolerance):
+            regressions.append('{}: median {:.2f} ms, was {:.2f} ms'.format(
+                name, result['median_ms'], before['median_ms']))
+        if (result['rss_growth_mb']
+                > max(before['rss_growth_mb'], 1) * (1 + tolerance)):
+            regressions.append('{}: peak RSS grew {:.1f} MB, was {:.1f} MB'
+                               .format(name, result['rss_growth_mb'],
+                                       before['rss_growth_mb']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data', help='nutrition_data.csv to use instead '
+                                       'of the synthetic dataset')
+    parser.add_argument('--rows', type=int, default=500000,
+                        help='foods in the synthetic dataset')
+    parser.add_argument('--rounds', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--max-time', type=float, default=5,
+                        help='seconds after which a case stops early')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON results of an earlier run')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+
+    if args.data:
+        nutrition_plotter.DATA_PATH = args.data
+    else:
+        directory = os.path.join(tempfile.gettempdir(),
+                                 'nutrition_benchmark_{}_{}'.format(
+                                     args.rows, args.seed))
+        os.makedirs(directory, exist_ok=True)
+        nutrition_plotter.DATA_PATH = os.path.join(directory,
+                                                   'nutrition_data.csv')
+        if not os.path.exists(nutrition_plotter.DATA_PATH):
+            print('Writing {} synthetic foods to {}'.format(
+                args.rows, nutrition_plotter.DATA_PATH))
+            write_synthetic_dataset(nutrition_plotter.DATA_PATH, args.rows,
+                                    args.seed)
+
+    app = QApplication(sys.argv)
+    diary_dir = tempfile.TemporaryDirectory()
+    start = time.perf_counter()
+    cases = hot_path_cases(app, args.seed,
+                           os.path.join(diary_dir.name, 'nutrition_diary.bin'))
+    print('Foods: {}, setup {:.1f} s, peak RSS {:.0f} MB'.format(
+        len(get_df()), time.perf_counter() - start, peak_rss_mb()))
+    print()
+    print('{:<14}{:>8}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}'.format(
+        'Case', 'Rounds', 'Min ms', 'Median', 'Mean', 'Max', 'Ops/s',
+        'RSS +MB'))
+
+    results = {}
+    for name, function in cases.items():
+        result = run_case(function, args.rounds, args.warmup,
+                          args.max_time)
+        results[name] = result
+        print('{:<14}{:>8}{:>10.3f}{:>10.3f}{:>10.3f}{:>10.3f}{:>10.1f}'
+              '{:>10.1f}'.format(name, *result.values()))
+    diary_dir.cleanup()
+
+    if args.save:
+        with open(args.save, 'w') as file:
+            json.dump(results, file, indent=1)
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        print()
+        print('\n'.join(regressions) or 'No regressions against {}'.format(
+            args.compare))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
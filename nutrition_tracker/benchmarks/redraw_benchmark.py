@@ -0,0 +1,69 @@
+"""Measures chart redraws per second while stepping through search results,
+comparing a new Canvas per food with updating one persistent Canvas.
+
+    python benchmarks/redraw_benchmark.py --data path/to/nutrition_data.csv
+"""
+import argparse
+import os
+import sys
+import time
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'application'))
+
+from PyQt5.QtWidgets import QApplication, QWidget
+import nutrition_plotter
+from nutrition_plotter import Canvas, get_df, get_rdi_df, search_foods
+
+
+def redraws_per_second(show_food, food_ids, app):
+    """Shows each food in turn, processing Qt events so that every update is
+    painted, and returns the redraw rate."""
+    start = time.perf_counter()
+    for food_id in food_ids:
+        show_food(food_id)
+        app.processEvents()
+    return len(food_ids) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data', default=nutrition_plotter.DATA_PATH)
+    parser.add_argument('--query', default='cheese')
+    parser.add_argument('--foods', type=int, default=50)
+    args = parser.parse_args()
+    nutrition_plotter.DATA_PATH = args.data
+
+    app = QApplication(sys.argv)
+    page = QWidget()
+    page.resize(835, 969)
+    page.show()
+    df, rdi_df = get_df(), get_rdi_df()
+    food_ids = list(search_foods(args.query, df).index[:args.foods])
+
+    def rebuild(food_id):
+        # The previous behaviour, a new figure and artists for every food.
+        if getattr(page, 'chart', None) is not None:
+            page.chart.deleteLater()
+        page.chart = Canvas(page, df, food_id, 100, rdi_df, True, 'Male', 70)
+        page.chart.show()
+        page.chart.draw()
+
+    persistent = Canvas(page)
+    persistent.show()
+
+    def update(food_id):
+        persistent.update_chart(df, food_id, 100, rdi_df, True, 'Male', 70)
+        persistent.draw()
+
+    print('Foods shown: {}'.format(len(food_ids)))
+    print('Rebuilt Canvas:    {:.1f} redraws/s'.format(
+        redraws_per_second(rebuild, food_ids, app)))
+    page.chart.deleteLater()
+    print('Persistent Canvas: {:.1f} redraws/s'.format(
+        redraws_per_second(update, food_ids, app)))
+
+
+if __name__ == '__main__':
+    main()
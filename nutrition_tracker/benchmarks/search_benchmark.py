@@ -0,0 +1,58 @@
+"""Compares the regex scan and the inverted index on the full food dataset.
+
+    python benchmarks/search_benchmark.py --data path/to/nutrition_data.csv
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'application'))
+
+import nutrition_plotter
+from nutrition_plotter import get_df, get_search_index, regex_search
+
+QUERIES = ['cheese', 'cheddar cheese', 'whole milk', 'chicken breast raw',
+           'apple', 'bread white', 'chocolate bar', 'orange juice',
+           'greek yogurt plain', 'beef ground cooked']
+
+
+def time_call(function, *args, repeats=5):
+    """Returns the best wall time of several calls in milliseconds."""
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function(*args)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data', default=nutrition_plotter.DATA_PATH)
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+    nutrition_plotter.DATA_PATH = args.data
+    df = get_df()
+
+    start = time.perf_counter()
+    index = get_search_index(df)
+    print('Rows: {}'.format(len(df)))
+    print('Index build: {:.2f} s'.format(time.perf_counter() - start))
+    print()
+    print('{:<22}{:>10}{:>12}{:>12}{:>10}'.format(
+        'Query', 'Results', 'Regex (ms)', 'Index (ms)', 'Speedup'))
+
+    # The index is timed directly, search_foods would answer repeats of a
+    # query from the incremental search's cache.
+    for query in QUERIES:
+        regex_ms = time_call(regex_search, query, df, repeats=args.repeats)
+        index_ms = time_call(index.search, query, repeats=args.repeats)
+        results = len(index.search(query))
+        print('{:<22}{:>10}{:>12.2f}{:>12.2f}{:>9.1f}x'.format(
+            query, results, regex_ms, index_ms, regex_ms / index_ms))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Times application data loading from the CSV and from the binary store.
+
+    python benchmarks/startup_benchmark.py --data path/to/nutrition_data.csv
+
+Each measurement runs in a fresh interpreter and excludes module imports.
+'Cold' is the first load after the store is removed, so it includes the
+one-time conversion; 'warm' loads an existing store. Page cache is not
+dropped, so cold disk reads are not shown.
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+
+APPLICATION_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               '..', 'application')
+
+CSV_LOAD = '''
+import time
+import pandas as pd
+start = time.perf_counter()
+df = pd.read_csv({path!r}, index_col=0)
+print(time.perf_counter() - start, df.memory_usage(deep=True).sum())
+'''
+
+STORE_LOAD = '''
+import sys, time
+sys.path.insert(0, {application_dir!r})
+import nutrition_plotter
+nutrition_plotter.DATA_PATH = {path!r}
+start = time.perf_counter()
+store = nutrition_plotter.get_food_store()
+opened = time.perf_counter() - start
+df = nutrition_plotter.get_df()
+print(time.perf_counter() - start, df.memory_usage(deep=True).sum(), opened)
+'''
+
+
+def run(script, **kwargs):
+    """Runs a timing script in a new interpreter, returning its outputs."""
+    output = subprocess.run(
+        [sys.executable, '-c', script.format(**kwargs)],
+        check=True, capture_output=True, text=True).stdout
+    return [float(value) for value in output.split()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data', default='nutrition_data.csv')
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+    path = os.path.abspath(args.data)
+
+    sys.path.insert(0, APPLICATION_DIR)
+    from food_store import default_store_dir
+    shutil.rmtree(default_store_dir(path), ignore_errors=True)
+
+    print('{:<34}{:>10}{:>14}'.format('Load', 'Time (s)', 'Memory (MB)'))
+    for repeat in range(args.repeats):
+        seconds, memory = run(CSV_LOAD, path=path)
+        print('{:<34}{:>10.2f}{:>14.1f}'.format(
+            'Before: read_csv', seconds, memory / 1e6))
+
+    for repeat in range(args.repeats + 1):
+        label = 'After: cold (build store)' if repeat == 0 else 'After: warm'
+        seconds, memory, opened = run(STORE_LOAD, path=path,
+                                      application_dir=APPLICATION_DIR)
+        print('{:<34}{:>10.2f}{:>14.1f}'.format(label, seconds, memory / 1e6))
+        print('{:<34}{:>10.3f}'.format('  of which opening the store', opened))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Replays typing sessions against the search, one query per keystroke, and
+reports per-keystroke latency for the incremental search and for searching
+the index from scratch.
+
+    python benchmarks/typing_benchmark.py --data path/to/nutrition_data.csv
+"""
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'application'))
+
+import nutrition_plotter
+from nutrition_plotter import get_df, get_search_index, regex_search
+from search_index import IncrementalSearch
+
+SESSIONS = ['cheddar cheese', 'chicken breast raw', 'whole milk',
+            'greek yogurt plain', 'white bread', 'orange juice',
+            'chocolate bar', 'beef ground cooked', 'brown rice',
+            'tomato soup', 'apple juice', 'pasta cooked', 'egg white',
+            'cheese pasta', 'chocolate milk']
+TARGET_P95_MS = 20
+
+
+def keystrokes(session):
+    """Returns the query after each keystroke of a typing session."""
+    return [session[:length] for length in range(1, len(session) + 1)]
+
+
+def replay(search, sessions):
+    """Times a search function on every keystroke, returns milliseconds."""
+    latencies = []
+    for session in sessions:
+        for query in keystrokes(session):
+            start = time.perf_counter()
+            search(query)
+            latencies.append((time.perf_counter() - start) * 1000)
+    return np.array(latencies)
+
+
+def report(name, latencies):
+    print('{:<20}{:>10}{:>10.2f}{:>10.2f}{:>10.2f}'.format(
+        name, len(latencies), np.percentile(latencies, 50),
+        np.percentile(latencies, 95), latencies.max()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data', default=nutrition_plotter.DATA_PATH)
+    parser.add_argument('--regex', action='store_true',
+                        help='also replay the sessions with regex_search')
+    args = parser.parse_args()
+    nutrition_plotter.DATA_PATH = args.data
+
+    df = get_df()
+    start = time.perf_counter()
+    index = get_search_index(df)
+    built = time.perf_counter()
+    index.warm_prefixes()
+    print('Rows: {}'.format(len(df)))
+    print('Index build: {:.2f} s, prefix warm-up: {:.2f} s'.format(
+        built - start, time.perf_counter() - built))
+    print()
+    print('{:<20}{:>10}{:>10}{:>10}{:>10}'.format(
+        'Search', 'Keys', 'p50 (ms)', 'p95 (ms)', 'max (ms)'))
+
+    report('Index, from scratch', replay(index.search, SESSIONS))
+    incremental = replay(IncrementalSearch(index).search, SESSIONS)
+    report('Incremental', incremental)
+    if args.regex:
+        report('Regex', replay(lambda query: regex_search(query, df),
+                               SESSIONS))
+
+    p95 = np.percentile(incremental, 95)
+    print()
+    print('Incremental p95 {:.2f} ms, target {} ms: {}'.format(
+        p95, TARGET_P95_MS, 'met' if p95 < TARGET_P95_MS else 'NOT met'))
+
+
+if __name__ == '__main__':
+    main()
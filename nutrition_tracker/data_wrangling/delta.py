@@ -0,0 +1,84 @@
+"""Writes the difference between two releases of nutrition_data.csv.
+
+    python delta.py nutrition_data.csv New_CSVs delta.npz --output new.csv
+
+The new release is built from the USDA files with ingest.py and compared
+with the previous nutrition_data.csv by fdc_id. Foods that are new, or whose
+nutrients or description differ, are written with their full rows; foods no
+longer present are listed by fdc_id. Clients apply the delta to their food
+store with application/update_foods.py instead of downloading and converting
+the whole dataset again.
+"""
+import argparse
+import os
+import time
+import numpy as np
+import pandas as pd
+from ingest import CHUNK_SIZE, build_dataset
+
+
+def diff_datasets(old, new):
+    """Compares two nutrition_data DataFrames. Returns the positions in new
+    of added and changed foods, and the fdc_ids of removed foods."""
+
+    old_ids = old['fdc_id'].to_numpy(dtype=np.int64)
+    new_ids = new['fdc_id'].to_numpy(dtype=np.int64)
+    common, old_rows, new_rows = np.intersect1d(old_ids, new_ids,
+                                                return_indices=True)
+
+    # Comparing as float32, as stored, with NaN equal to NaN.
+    old_values = old.iloc[old_rows, 1:-2].to_numpy(dtype=np.float32)
+    new_values = new.iloc[new_rows, 1:-2].to_numpy(dtype=np.float32)
+    same_values = ((old_values == new_values)
+                   | (np.isnan(old_values) & np.isnan(new_values))).all(axis=1)
+    same_descriptions = (
+        old['Description'].fillna('').to_numpy()[old_rows]
+        == new['Description'].fillna('').to_numpy()[new_rows])
+
+    changed = np.sort(new_rows[~(same_values & same_descriptions)])
+    added = np.flatnonzero(~np.isin(new_ids, common))
+    removed = old_ids[~np.isin(old_ids, common)]
+    return added, changed, removed
+
+
+def write_delta(path, new, added, changed, removed, release):
+    """Saves the rows of added and changed foods and the removed fdc_ids."""
+
+    rows = np.concatenate([changed, added])
+    np.savez(path,
+             release=np.array(release),
+             nutrient_names=np.array(new.columns[1:-2], dtype=str),
+             fdc_id=new['fdc_id'].to_numpy(dtype=np.int64)[rows],
+             nutrients=new.iloc[rows, 1:-2].to_numpy(dtype=np.float32),
+             descriptions=new['Description'].fillna('').to_numpy(
+                 dtype=str)[rows],
+             completeness=new['Completeness (%)'].to_numpy(
+                 dtype=np.float64)[rows],
+             removed=np.asarray(removed, dtype=np.int64))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Writes the changes between two dataset releases.')
+    parser.add_argument('previous', help='the previous nutrition_data.csv')
+    parser.add_argument('release_dir', help='directory of the new USDA CSVs')
+    parser.add_argument('delta', help='path of the .npz delta to write')
+    parser.add_argument('--output', help='also write the new release\'s '
+                                         'nutrition_data.csv here')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    old = pd.read_csv(args.previous, index_col=0)
+    new = build_dataset(args.release_dir, args.chunk_size)
+    added, changed, removed = diff_datasets(old, new)
+    write_delta(args.delta, new, added, changed, removed,
+                os.path.basename(os.path.normpath(args.release_dir)))
+    if args.output:
+        new.to_csv(args.output)
+    print('{} added, {} changed, {} removed in {:.1f} s'.format(
+        len(added), len(changed), len(removed), time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main()
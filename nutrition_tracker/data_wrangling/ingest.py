@@ -0,0 +1,180 @@
+"""Builds nutrition_data.csv from a FoodData Central release.
+
+    python ingest.py New_CSVs ../application/nutrition_data.csv
+
+Produces the same dataset as Notebook.ipynb without reading food_nutrient.csv
+into memory: the file is streamed in chunks, rows for other nutrients or
+foods are dropped as each chunk arrives, and the remaining amounts are
+written straight into a float32 matrix with a row per kept food and a
+column per nutrient. Runtime and peak RSS are printed on completion;
+--notebook runs the notebook's pandas pivot instead, for comparison.
+"""
+import argparse
+import os
+import resource
+import time
+import numpy as np
+import pandas as pd
+
+# The 48 nutrients kept by the application, in column order.
+NUTRIENT_IDS = [1008, 1051, 1057, 1018, 1005, 1079, 1009, 2000, 1004, 1292,
+                1293, 1258, 1257, 1253, 1003, 1221, 1212, 1213, 1214, 1215,
+                1217, 1211, 1210, 1219, 1165, 1166, 1167, 1170, 1175, 1177,
+                1178, 1180, 1104, 1162, 1110, 1109, 1185, 1087, 1098, 1100,
+                1089, 1090, 1101, 1091, 1092, 1103, 1093, 1095]
+NAME_OVERRIDES = {1292: 'Monounsaturated fat', 1293: 'Polyunsaturated fat',
+                  1258: 'Saturated fat', 1257: 'Trans fat'}
+DATA_TYPES = ['branded_food', 'sr_legacy_food', 'survey_fndds_food']
+CHUNK_SIZE = 2000000
+
+
+def read_foods(path):
+    """Returns the kept foods' fdc_ids, sorted, and their lowercase
+    descriptions."""
+
+    foods = pd.read_csv(path, usecols=['fdc_id', 'data_type', 'description'])
+    foods = foods.dropna(subset=['description'])
+    foods = foods[foods.data_type.isin(DATA_TYPES)]
+    foods = foods.sort_values('fdc_id', kind='stable')
+    return (foods['fdc_id'].to_numpy(dtype=np.int64),
+            foods['description'].str.lower().to_numpy())
+
+
+def nutrient_column_names(path):
+    """Names each nutrient column 'name (unit)' as the notebook does."""
+
+    nutrients = pd.read_csv(path, usecols=['id', 'name', 'unit_name'])
+    nutrients = nutrients.set_index('id').loc[NUTRIENT_IDS]
+    for nutrient_id, name in NAME_OVERRIDES.items():
+        nutrients.loc[nutrient_id, 'name'] = name
+    return [name.split(',')[0].split('(')[0] + ' ({})'.format(unit.lower())
+            for name, unit in zip(nutrients.name, nutrients.unit_name)]
+
+
+def stream_nutrients(path, fdc_ids, chunk_size=CHUNK_SIZE):
+    """Reads the amounts of the kept nutrients for the given sorted fdc_ids.
+    Returns the (foods, 48) float32 matrix, NaN where a food has no value,
+    and whether each food appeared in the file at all."""
+
+    values = np.full((len(fdc_ids), len(NUTRIENT_IDS)), np.nan,
+                     dtype=np.float32)
+    seen = np.zeros(len(fdc_ids), dtype=bool)
+    column_of = np.full(max(NUTRIENT_IDS) + 1, -1, dtype=np.int64)
+    column_of[NUTRIENT_IDS] = np.arange(len(NUTRIENT_IDS))
+    if len(fdc_ids) == 0:
+        return values, seen
+
+    chunks = pd.read_csv(path, usecols=['fdc_id', 'nutrient_id', 'amount'],
+                         dtype={'fdc_id': np.int64, 'nutrient_id': np.int64,
+                                'amount': np.float32},
+                         chunksize=chunk_size)
+    for chunk in chunks:
+        # Dropping rows of foods that are not kept.
+        chunk_ids = chunk['fdc_id'].to_numpy()
+        rows = np.minimum(np.searchsorted(fdc_ids, chunk_ids),
+                          len(fdc_ids) - 1)
+        kept = fdc_ids[rows] == chunk_ids
+        rows = rows[kept]
+        seen[rows] = True
+
+        # Dropping rows of nutrients that are not kept.
+        nutrient_ids = chunk['nutrient_id'].to_numpy()[kept]
+        columns = np.full(len(nutrient_ids), -1, dtype=np.int64)
+        known = (nutrient_ids >= 0) & (nutrient_ids < len(column_of))
+        columns[known] = column_of[nutrient_ids[known]]
+        wanted = columns >= 0
+        values[rows[wanted], columns[wanted]] = (
+            chunk['amount'].to_numpy()[kept][wanted])
+    return values, seen
+
+
+def completeness(values):
+    """The percentage of nutrients with a value for each food."""
+    return np.round((~np.isnan(values)).sum(axis=1) / values.shape[1] * 100,
+                    1)
+
+
+def build_dataset(release_dir, chunk_size=CHUNK_SIZE):
+    """Returns the nutrition_data DataFrame for a release directory holding
+    food.csv, nutrient.csv and food_nutrient.csv."""
+
+    fdc_ids, descriptions = read_foods(os.path.join(release_dir, 'food.csv'))
+    names = nutrient_column_names(os.path.join(release_dir, 'nutrient.csv'))
+    values, seen = stream_nutrients(
+        os.path.join(release_dir, 'food_nutrient.csv'), fdc_ids, chunk_size)
+
+    # Foods without any nutrient rows are left out, as the notebook's join did.
+    values = values[seen]
+    df = pd.DataFrame(values, columns=names)
+    df.insert(0, 'fdc_id', fdc_ids[seen])
+    df['Description'] = descriptions[seen]
+    df['Completeness (%)'] = completeness(values)
+    return df
+
+
+def notebook_dataset(release_dir):
+    """The notebook's original pivot, kept to compare runtime and memory."""
+
+    food_names = pd.read_csv(os.path.join(release_dir, 'food.csv'))
+    nutrient_values = pd.read_csv(
+        os.path.join(release_dir, 'food_nutrient.csv'))
+
+    food_names = food_names.dropna(subset=['description'])
+    food_names = food_names[food_names.data_type.isin(DATA_TYPES)]
+    food_names = food_names[['fdc_id', 'description']]
+    food_names.description = food_names.description.str.lower()
+
+    nutrient_values = nutrient_values.iloc[:, 1:4]
+    nutrient_values = nutrient_values.pivot(index='fdc_id',
+                                            columns='nutrient_id',
+                                            values='amount')
+    nutrient_values = nutrient_values.reindex(
+        columns=NUTRIENT_IDS).reset_index()
+    nutrient_values.columns.name = None
+    nutrient_values = nutrient_values[
+        nutrient_values.fdc_id.isin(food_names.fdc_id)]
+
+    df = nutrient_values.set_index('fdc_id').join(
+        food_names.set_index('fdc_id')).reset_index()
+    df.columns = (['fdc_id']
+                  + nutrient_column_names(os.path.join(release_dir,
+                                                       'nutrient.csv'))
+                  + ['Description'])
+    df['Completeness (%)'] = df.iloc[:, 1:-1].apply(
+        lambda x: (x.notnull().sum() / 48) * 100, axis=1).round(1)
+    return df
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process, ru_maxrss is in KiB on
+    Linux."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Builds nutrition_data.csv from a USDA release.')
+    parser.add_argument('release_dir',
+                        help='directory with food.csv, nutrient.csv and '
+                             'food_nutrient.csv')
+    parser.add_argument('output', help='path of the nutrition_data.csv')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                        help='food_nutrient.csv rows read at a time')
+    parser.add_argument('--notebook', action='store_true',
+                        help='use the notebook\'s in-memory pivot instead')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.notebook:
+        df = notebook_dataset(args.release_dir)
+    else:
+        df = build_dataset(args.release_dir, args.chunk_size)
+    built = time.perf_counter()
+    df.to_csv(args.output)
+    print('{} foods in {:.1f} s ({:.1f} s writing), peak RSS {:.0f} MB'.format(
+        len(df), time.perf_counter() - start, time.perf_counter() - built,
+        peak_rss_mb()))
+
+
+if __name__ == '__main__':
+    main()